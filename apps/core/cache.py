@@ -0,0 +1,44 @@
+"""
+Cache par générations, partagé par les applications
+Chaque clé inclut la génération des modèles (ou des objets) dont elle dépend ;
+changer une génération invalide d'un coup toutes les entrées concernées sans
+avoir à les énumérer. Chaque application utilise son propre espace de noms
+(ex. 'renaloc', 'eftp_formel') comme préfixe des clés.
+"""
+
+import time
+from django.core.cache import cache
+
+
+def _cle_generation(espace, nom):
+    return f'{espace}:generation:{nom}'
+
+
+def generation(espace, nom):
+    """Génération courante d'un nom de l'espace (créée à la volée si absente du cache)"""
+    cle = _cle_generation(espace, nom)
+    valeur = cache.get(cle)
+    if valeur is None:
+        valeur = time.time_ns()
+        cache.add(cle, valeur, None)
+        valeur = cache.get(cle, valeur)
+    return valeur
+
+
+def invalider(espace, noms):
+    """Invalide toutes les entrées de l'espace dépendant des noms donnés"""
+    for nom in noms:
+        # Horodatage plutôt qu'un compteur : une génération évincée du cache
+        # ne peut pas réutiliser une ancienne valeur
+        cache.set(_cle_generation(espace, nom), time.time_ns(), None)
+
+
+def get_or_set(espace, cle, noms, calcul, timeout):
+    """Retourne la valeur en cache pour `cle`, ou la calcule et la stocke"""
+    generations = '.'.join(str(generation(espace, nom)) for nom in noms)
+    cle_complete = f'{espace}:{cle}:{generations}'
+    valeur = cache.get(cle_complete)
+    if valeur is None:
+        valeur = calcul()
+        cache.set(cle_complete, valeur, timeout)
+    return valeur
@@ -0,0 +1,48 @@
+"""
+Règle de complétude exprimée en SQL
+Même règle que get_completion_percentage() (un champ compte s'il n'est ni NULL,
+ni vide, ni False, ni 0), mais calculée par la base avec des Case/When : utilisable
+dans filter(), order_by() et aggregate() sans charger les objets.
+"""
+
+from django.db import models
+from django.db.models import Case, ExpressionWrapper, IntegerField, Q, Value, When
+
+
+def champ_rempli(model, nom):
+    """Condition Q équivalente au test Python `valeur not in [None, '', False, []]`"""
+    field = model._meta.get_field(nom)
+    if isinstance(field, models.BooleanField):
+        return Q(**{nom: True})
+    condition = Q(**{f'{nom}__isnull': False})
+    if isinstance(field, (models.CharField, models.TextField)):
+        condition &= ~Q(**{nom: ''})
+    elif isinstance(field, (models.DecimalField, models.IntegerField, models.FloatField)):
+        # 0 == False en Python : une coordonnée à 0 compte comme vide
+        condition &= ~Q(**{nom: 0})
+    return condition
+
+
+def expression_completion(model, champs):
+    """Pourcentage entier de champs remplis, calculé en SQL"""
+    remplis = sum(
+        (Case(When(champ_rempli(model, nom), then=Value(1)), default=Value(0), output_field=IntegerField())
+         for nom in champs),
+        Value(0),
+    )
+    return ExpressionWrapper(remplis * Value(100) / Value(len(champs)), output_field=IntegerField())
+
+
+class CompletionQuerySet(models.QuerySet):
+    """QuerySet des modèles qui déclarent CHAMPS_COMPLETION"""
+
+    def expression_completion(self):
+        return expression_completion(self.model, self.model.CHAMPS_COMPLETION)
+
+    def avec_completion(self):
+        """Annote `completion`, le taux calculé en SQL à partir des colonnes actuelles"""
+        return self.annotate(completion=self.expression_completion())
+
+    def completion_inferieure(self, seuil):
+        """Objets dont le taux calculé est strictement inférieur à `seuil`"""
+        return self.avec_completion().filter(completion__lt=seuil)
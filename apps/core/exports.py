@@ -0,0 +1,203 @@
+"""
+Réponses d'export en flux (CSV ou XLSX) et agrégats par sous-requête
+Partagés par les exports et l'admin des applications : les lignes sont lues par
+paquets avec .iterator(), la mémoire reste constante quel que soit le volume.
+"""
+
+import csv
+import datetime
+import decimal
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+from django.db.models import IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+
+def lignes_queryset(queryset, colonnes):
+    """En-tête puis lignes d'un queryset (sélection de l'admin) sans précharger les relations"""
+    yield [entete for entete, _ in colonnes]
+    champs = [champ for _, champ in colonnes]
+    yield from queryset.prefetch_related(None).values_list(*champs).iterator(chunk_size=CHUNK_SIZE)
+
+
+def total_lie(model, agregat, lien='etablissement'):
+    """Sous-requête : agrégat des lignes de `model` liées à l'objet courant par `lien` (0 si aucune)"""
+    sous_requete = (
+        model.objects.filter(**{lien: OuterRef('pk')})
+        .order_by().values(lien).annotate(total=agregat).values('total')
+    )
+    return Coalesce(Subquery(sous_requete, output_field=IntegerField()), 0)
+
+
+class Echo:
+    """Pseudo-fichier : write() renvoie la ligne au lieu de la stocker"""
+
+    def write(self, value):
+        return value
+
+
+def reponse_csv(lignes, nom_fichier):
+    """Réponse CSV envoyée au fur et à mesure de la lecture des lignes"""
+    writer = csv.writer(Echo())
+    response = StreamingHttpResponse(
+        (writer.writerow(ligne) for ligne in lignes), content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
+
+
+class TamponZip:
+    """Flux en écriture seule pour zipfile : les octets écrits sont rendus à chaque vidage"""
+
+    def __init__(self):
+        self.morceaux = []
+
+    def write(self, donnees):
+        self.morceaux.append(bytes(donnees))
+        return len(donnees)
+
+    def flush(self):
+        pass
+
+    def vider(self):
+        donnees = b''.join(self.morceaux)
+        self.morceaux = []
+        return donnees
+
+
+# Parties fixes du classeur XLSX (SpreadsheetML minimal : styles 1 = date, 2 = date et heure)
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG = 'http://schemas.openxmlformats.org/package/2006/relationships'
+ENTETE_XML = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+STYLES_XLSX = (
+    f'{ENTETE_XML}<styleSheet xmlns="{NS_MAIN}">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+# Caractères de contrôle interdits dans le XML
+CARACTERES_INTERDITS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+EPOQUE_EXCEL = datetime.datetime(1899, 12, 30)
+
+
+def _colonne(index):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA'"""
+    lettres = ''
+    index += 1
+    while index:
+        index, reste = divmod(index - 1, 26)
+        lettres = chr(65 + reste) + lettres
+    return lettres
+
+
+def _nom_feuille(titre):
+    """Nom d'onglet valide (31 caractères, sans []:*?/\\), en attribut XML"""
+    return quoteattr(re.sub(r'[][:*?/\\]', '-', titre)[:31])
+
+
+def _cellule(reference, valeur):
+    if valeur is None or valeur == '':
+        return ''
+    if isinstance(valeur, bool):
+        return f'<c r="{reference}" t="b"><v>{int(valeur)}</v></c>'
+    if isinstance(valeur, (int, float, decimal.Decimal)):
+        return f'<c r="{reference}"><v>{valeur}</v></c>'
+    if isinstance(valeur, datetime.datetime):
+        if timezone.is_aware(valeur):
+            valeur = timezone.make_naive(valeur)
+        serie = (valeur - EPOQUE_EXCEL).total_seconds() / 86400
+        return f'<c r="{reference}" s="2"><v>{serie}</v></c>'
+    if isinstance(valeur, datetime.date):
+        serie = (valeur - EPOQUE_EXCEL.date()).days
+        return f'<c r="{reference}" s="1"><v>{serie}</v></c>'
+    texte = escape(CARACTERES_INTERDITS.sub('', str(valeur)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{texte}</t></is></c>'
+
+
+def _ligne_xml(numero, ligne):
+    cellules = ''.join(_cellule(f'{_colonne(index)}{numero}', valeur) for index, valeur in enumerate(ligne))
+    return f'<row r="{numero}">{cellules}</row>'
+
+
+def flux_xlsx(feuilles):
+    """
+    Classeur XLSX, une feuille par couple (titre, lignes), produit au fur et à mesure
+    de la lecture des lignes : chaque feuille est écrite en XML directement dans
+    l'archive, vidée tous les CHUNK_SIZE lignes (mémoire constante, premiers octets
+    envoyés sans attendre la fin du classeur)
+    """
+    feuilles = list(feuilles)
+    tampon = TamponZip()
+    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+        surcharges = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{numero}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for numero in range(1, len(feuilles) + 1)
+        )
+        archive.writestr('[Content_Types].xml', (
+            f'{ENTETE_XML}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{surcharges}</Types>'
+        ))
+        archive.writestr('_rels/.rels', (
+            f'{ENTETE_XML}<Relationships xmlns="{NS_PKG}">'
+            f'<Relationship Id="rId1" Type="{NS_REL}/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+        ))
+        onglets = ''.join(
+            f'<sheet name={_nom_feuille(titre)} sheetId="{numero}" r:id="rId{numero}"/>'
+            for numero, (titre, _) in enumerate(feuilles, 1)
+        )
+        archive.writestr('xl/workbook.xml', (
+            f'{ENTETE_XML}<workbook xmlns="{NS_MAIN}" xmlns:r="{NS_REL}"><sheets>{onglets}</sheets></workbook>'
+        ))
+        relations = ''.join(
+            f'<Relationship Id="rId{numero}" Type="{NS_REL}/worksheet" Target="worksheets/sheet{numero}.xml"/>'
+            for numero in range(1, len(feuilles) + 1)
+        )
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            f'{ENTETE_XML}<Relationships xmlns="{NS_PKG}">{relations}'
+            f'<Relationship Id="rId{len(feuilles) + 1}" Type="{NS_REL}/styles" Target="styles.xml"/></Relationships>'
+        ))
+        archive.writestr('xl/styles.xml', STYLES_XLSX)
+        yield tampon.vider()
+
+        for numero_feuille, (_, lignes) in enumerate(feuilles, 1):
+            with archive.open(f'xl/worksheets/sheet{numero_feuille}.xml', 'w') as fichier:
+                fichier.write(f'{ENTETE_XML}<worksheet xmlns="{NS_MAIN}"><sheetData>'.encode())
+                morceaux = []
+                for numero, ligne in enumerate(lignes, 1):
+                    morceaux.append(_ligne_xml(numero, ligne))
+                    if numero % CHUNK_SIZE == 0:
+                        fichier.write(''.join(morceaux).encode())
+                        morceaux = []
+                        yield tampon.vider()
+                morceaux.append('</sheetData></worksheet>')
+                fichier.write(''.join(morceaux).encode())
+            yield tampon.vider()
+    yield tampon.vider()
+
+
+def reponse_xlsx(feuilles, nom_fichier):
+    """Réponse XLSX envoyée au fur et à mesure de l'écriture du classeur (voir flux_xlsx)"""
+    response = StreamingHttpResponse(
+        flux_xlsx(feuilles), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
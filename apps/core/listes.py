@@ -0,0 +1,84 @@
+"""
+Filtres et pagination des listes (établissements formels, structures non formelles)
+Les filtres viennent des paramètres GET ; la pagination se fait par clé sur le code
+unique (WHERE code > x ORDER BY code LIMIT n) : coût constant quelle que soit la
+position dans la liste, sans OFFSET.
+"""
+
+from django.db.models import Q
+
+TAILLE_PAGE = 50
+
+# Recherche libre (paramètre q) : début du code, nom ou sigle
+RECHERCHE = ('code__istartswith', 'nom__icontains', 'sigle__icontains')
+
+
+def filtrer(queryset, params, champs, booleens=(), tranches=None, recherche=RECHERCHE):
+    """
+    Applique les filtres d'une liste et renvoie (queryset, filtres actifs)
+    - champs : paramètre -> champ filtré par égalité (un champ *_id attend un entier)
+    - booleens : champs filtrés par leur propre nom de paramètre, valeur 1 ou 0
+    - tranches : paramètre -> {valeur: conditions}, ex. les niveaux de complétude
+    Lève ValueError si une valeur est invalide.
+    """
+    filtres = {}
+    for parametre, champ in champs.items():
+        valeur = params.get(parametre, '').strip()
+        if not valeur:
+            continue
+        if champ.endswith('_id') and not valeur.isdigit():
+            raise ValueError(f"{parametre} : identifiant invalide")
+        filtres[parametre] = valeur
+        queryset = queryset.filter(**{champ: valeur})
+    for champ in booleens:
+        valeur = params.get(champ, '').strip()
+        if not valeur:
+            continue
+        if valeur not in ('0', '1'):
+            raise ValueError(f"{champ} : valeur attendue 1 ou 0")
+        filtres[champ] = valeur
+        queryset = queryset.filter(**{champ: valeur == '1'})
+    for parametre, valeurs in (tranches or {}).items():
+        valeur = params.get(parametre, '').strip()
+        if not valeur:
+            continue
+        if valeur not in valeurs:
+            raise ValueError(f"{parametre} : valeur attendue parmi {', '.join(valeurs)}")
+        filtres[parametre] = valeur
+        queryset = queryset.filter(**valeurs[valeur])
+    q = params.get('q', '').strip()
+    if q:
+        filtres['q'] = q
+        condition = Q()
+        for lookup in recherche:
+            condition |= Q(**{lookup: q})
+        queryset = queryset.filter(condition)
+    return queryset, filtres
+
+
+def _code(ligne):
+    return ligne['code'] if isinstance(ligne, dict) else ligne.code
+
+
+def page_par_code(queryset, apres=None, avant=None, taille=TAILLE_PAGE):
+    """
+    Page de `taille` lignes (objets ou dictionnaires de values(), qui doivent contenir
+    le code) avant ou après un code ; renvoie les lignes et les curseurs des pages voisines
+    """
+    if avant:
+        lignes = list(queryset.filter(code__lt=avant).order_by('-code')[:taille + 1])
+        precedente = len(lignes) > taille
+        lignes = lignes[:taille][::-1]
+        suivante = True
+    else:
+        if apres:
+            queryset = queryset.filter(code__gt=apres)
+        lignes = list(queryset.order_by('code')[:taille + 1])
+        suivante = len(lignes) > taille
+        lignes = lignes[:taille]
+        precedente = bool(apres)
+    return {
+        'lignes': lignes,
+        'apres': _code(lignes[-1]) if lignes and suivante else None,
+        'avant': _code(lignes[0]) if lignes and precedente else None,
+    }
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from apps.eftp_formel.models import EtablissementFormel
+from apps.eftp_formel import cache as formel_cache
+from apps.eftp_non_formel.models import StructureNonFormelle
+
+MODELES = {
+    'formel': EtablissementFormel,
+    'non_formel': StructureNonFormelle,
+}
+
+class Command(BaseCommand):
+    help = 'Recalcule le taux de complétude enregistré des établissements formels et structures non formelles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modele', choices=list(MODELES), action='append',
+                          help='Modèle à recalculer (par défaut : tous)')
+
+    def handle(self, *args, **options):
+        for nom in options['modele'] or list(MODELES):
+            model = MODELES[nom]
+            # Un seul UPDATE, limité aux lignes dont le taux enregistré diffère du taux calculé en SQL
+            expression = model.objects.expression_completion()
+            modifies = model.objects.exclude(taux_completion=expression).update(taux_completion=expression)
+            if modifies and model is EtablissementFormel:
+                # update() n'émet pas de signaux
+                formel_cache.invalider('etablissementformel')
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.verbose_name_plural} : {model.objects.count()} lu(s), {modifies} mis à jour"
+            ))
@@ -58,13 +58,13 @@ def dashboard(request):
 @login_required
 def dashboard(request):
     """Tableau de bord (nécessite authentification)"""
-    from apps.eftp_formel.models import EtablissementFormel
+    from apps.eftp_formel.models import EtablissementFormel, SEUIL_COMPLETION
     from apps.eftp_non_formel.models import StructureNonFormelle
     from apps.renaloc.models import Region, Departement, Commune
     
-    # Compter les établissements avec données complètes
+    # Compter les établissements avec données complètes (COUNT sur l'index taux_completion)
     etablissements = EtablissementFormel.objects.all()
-    etablissements_complets = sum(1 for e in etablissements if e.has_complete_data())
+    etablissements_complets = etablissements.filter(taux_completion__gte=SEUIL_COMPLETION).count()
     
     context = {
         'nb_etablissements_formels': etablissements.count(),
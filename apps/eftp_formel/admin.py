@@ -1,10 +1,15 @@
+import itertools
 from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from .models import EtablissementFormel, ApprenantFormel, FiliereFormel, FormateurFormel
 from django.contrib import admin
+from django.db.models import F, Sum
 from django.utils.html import format_html
 from .models import EtablissementFormel, ApprenantFormel, FiliereFormel, FormateurFormel
+from . import exports
+from apps.renaloc.admin import DepartementListFilter
+from apps.core.exports import CHUNK_SIZE, reponse_csv, total_lie
 
 class ApprenantInline(admin.TabularInline):
     model = ApprenantFormel
@@ -27,8 +32,9 @@ class FormateurInline(admin.TabularInline):
 @admin.register(EtablissementFormel)
 class EtablissementFormelAdmin(admin.ModelAdmin):
     list_display = ('code', 'sigle', 'nom', 'statut_badge', 'zone', 'region', 'departement', 
-                   'type_etablissement', 'nb_apprenants')
-    list_filter = ('statut', 'zone', 'type_etablissement', 'region', 'departement')
+                   'type_etablissement', 'nb_apprenants', 'taux_completion')
+    list_filter = ('statut', 'zone', 'type_etablissement', 'region', ('departement', DepartementListFilter))
+    list_select_related = ('region', 'departement__region')
     search_fields = ('code', 'sigle', 'nom', 'region__nom', 'departement__nom', 'commune__nom')
     readonly_fields = ('created_at', 'updated_at')
     date_hierarchy = 'date_ouverture'
@@ -82,33 +88,30 @@ class EtablissementFormelAdmin(admin.ModelAdmin):
             return format_html('<span style="background-color: #ffc107; color: black; padding: 3px 8px; border-radius: 3px;">Privé</span>')
     statut_badge.short_description = "Statut"
     
+    def get_queryset(self, request):
+        # Total calculé par la base (sous-requête) : triable, sans requête par ligne
+        return super().get_queryset(request).annotate(
+            total_apprenants=total_lie(ApprenantFormel, Sum(F('masculin') + F('feminin')))
+        )
+    
     def nb_apprenants(self, obj):
-        total = sum(app.masculin + app.feminin for app in obj.apprenants.all())
-        return total
+        return obj.total_apprenants
     nb_apprenants.short_description = "Total apprenants"
+    nb_apprenants.admin_order_field = 'total_apprenants'
     
     def exporter_selection(self, request, queryset):
-        from django.http import HttpResponse
-        import csv
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="etablissements_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Code', 'Sigle', 'Nom', 'Statut', 'Région', 'Type', 'Apprenants'])
-        
-        for etab in queryset:
-            writer.writerow([
-                etab.code,
-                etab.sigle,
-                etab.nom,
-                etab.get_statut_display(),
-                etab.region.nom,
-                etab.get_type_etablissement_display(),
-                etab.apprenants.count()
-            ])
-        
+        statuts = dict(EtablissementFormel.STATUT_CHOICES)
+        types = dict(EtablissementFormel.TYPE_ETABLISSEMENT_CHOICES)
+        lignes = exports.annoter_totaux(queryset.prefetch_related(None)).values_list(
+            'code', 'sigle', 'nom', 'statut', 'region__nom', 'type_etablissement', 'apprenants_m', 'apprenants_f'
+        ).iterator(chunk_size=CHUNK_SIZE)
+        lignes = itertools.chain(
+            [['Code', 'Sigle', 'Nom', 'Statut', 'Région', 'Type', 'Apprenants']],
+            ((code, sigle, nom, statuts.get(statut, statut), region, types.get(type_, type_), m + f)
+             for code, sigle, nom, statut, region, type_, m, f in lignes),
+        )
         self.message_user(request, f"{queryset.count()} établissement(s) exporté(s)")
-        return response
+        return reponse_csv(lignes, 'etablissements_export.csv')
     exporter_selection.short_description = "Exporter la sélection (CSV)"
     
     class Media:
@@ -122,9 +125,13 @@ class ApprenantFormelAdmin(admin.ModelAdmin):
     list_filter = ('cycle', 'annee_etude', 'etablissement__region')
     search_fields = ('etablissement__nom', 'etablissement__code')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(total_effectif=F('masculin') + F('feminin'))
+    
     def total(self, obj):
-        return obj.masculin + obj.feminin
+        return obj.total_effectif
     total.short_description = "Total"
+    total.admin_order_field = 'total_effectif'
 
 @admin.register(FiliereFormel)
 class FiliereFormelAdmin(admin.ModelAdmin):
@@ -132,9 +139,13 @@ class FiliereFormelAdmin(admin.ModelAdmin):
     list_filter = ('secteur', 'cycle', 'stage_obligatoire', 'etablissement__region')
     search_fields = ('nom_filiere', 'etablissement__nom', 'diplome_prepare')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(total_effectif=F('effectif_m') + F('effectif_f'))
+    
     def effectif_total(self, obj):
-        return obj.effectif_m + obj.effectif_f
+        return obj.total_effectif
     effectif_total.short_description = "Effectif total"
+    effectif_total.admin_order_field = 'total_effectif'
 
 @admin.register(FormateurFormel)
 class FormateurFormelAdmin(admin.ModelAdmin):
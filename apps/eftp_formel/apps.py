@@ -3,4 +3,8 @@ from django.apps import AppConfig
 class EftpFormelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.eftp_formel'
-    verbose_name = "EFTP Formel - Établissements"
\ No newline at end of file
+    verbose_name = "EFTP Formel - Établissements"
+
+    def ready(self):
+        """Connexion des signaux d'invalidation du cache des statistiques"""
+        import apps.eftp_formel.signals
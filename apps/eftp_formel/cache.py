@@ -0,0 +1,27 @@
+"""
+Cache des statistiques EFTP formel
+Générations de apps/core/cache.py dans l'espace 'eftp_formel' : par modèle,
+et par établissement ('etablissement:<pk>') pour les fiches détaillées.
+"""
+
+from apps.core import cache as core_cache
+
+ESPACE = 'eftp_formel'
+
+# Noms des modèles (Model._meta.model_name)
+MODELES = ('etablissementformel', 'apprenantformel', 'filiereformel', 'formateurformel')
+
+TIMEOUT = 60 * 60
+
+
+def generation(nom):
+    return core_cache.generation(ESPACE, nom)
+
+
+def invalider(*noms):
+    """Invalide toutes les entrées dépendant des noms donnés (tous les modèles par défaut)"""
+    core_cache.invalider(ESPACE, noms or MODELES)
+
+
+def get_or_set(cle, noms, calcul, timeout=TIMEOUT):
+    return core_cache.get_or_set(ESPACE, cle, noms, calcul, timeout)
@@ -0,0 +1,107 @@
+"""
+Export en flux du registre EFTP formel (établissements, apprenants, filières, formateurs)
+Une requête par feuille, parcourue par paquets avec .iterator() ; les totaux des
+établissements sont calculés en SQL par sous-requêtes. Les colonnes reprennent
+celles des modèles d'import (generate_templates.py).
+"""
+
+import csv
+import datetime
+import io
+import zipfile
+from django.db.models import Case, Count, Sum, Value, When
+from django.http import StreamingHttpResponse
+from apps.core.exports import CHUNK_SIZE, TamponZip, reponse_csv, reponse_xlsx, total_lie
+from .models import EtablissementFormel, ApprenantFormel, FiliereFormel, FormateurFormel
+
+
+def annoter_totaux(queryset):
+    """Totaux par établissement, sans jointure multiple (une sous-requête par total)"""
+    return queryset.annotate(
+        apprenants_m=total_lie(ApprenantFormel, Sum('masculin')),
+        apprenants_f=total_lie(ApprenantFormel, Sum('feminin')),
+        nb_filieres=total_lie(FiliereFormel, Count('id')),
+        nb_formateurs=total_lie(FormateurFormel, Count('id')),
+    )
+
+
+def oui_non(champ):
+    return Case(When(**{champ: True}, then=Value('OUI')), default=Value('NON'))
+
+
+# Nom -> (titre de la feuille, queryset, [(en-tête, champ)])
+FEUILLES = {
+    'etablissement': ('Établissements', lambda: annoter_totaux(EtablissementFormel.objects.all()), [
+        ('Code', 'code'), ('Nom', 'nom'), ('Sigle', 'sigle'), ('Statut', 'statut'), ('Zone', 'zone'),
+        ('Région', 'region__nom'), ('Département', 'departement__nom'), ('Commune', 'commune__nom'),
+        ('Quartier/Village', 'quartier_village__nom'), ("Type d'établissement", 'type_etablissement'),
+        ('Régime', 'regime'), ('Date autorisation', 'date_autorisation'), ("Date d'ouverture", 'date_ouverture'),
+        ('Adresse', 'adresse'), ('Longitude', 'longitude'), ('Latitude', 'latitude'),
+        ('Complétude (%)', 'taux_completion'), ('Apprenants M', 'apprenants_m'), ('Apprenants F', 'apprenants_f'),
+        ('Filières', 'nb_filieres'), ('Formateurs', 'nb_formateurs'),
+    ]),
+    'apprenant': ('Apprenants', lambda: ApprenantFormel.objects.order_by('etablissement__code', 'cycle', 'annee_etude'), [
+        ('Code Établissement', 'etablissement__code'), ('Cycle', 'cycle'), ('Année étude', 'annee_etude'),
+        ('Masculin', 'masculin'), ('Féminin', 'feminin'),
+        ('Redoublants M', 'redoublants_m'), ('Redoublants F', 'redoublants_f'),
+    ]),
+    'filiere': ('Filières', lambda: FiliereFormel.objects.annotate(stage=oui_non('stage_obligatoire'))
+                .order_by('etablissement__code', 'nom_filiere'), [
+        ('Code Établissement', 'etablissement__code'), ('Secteur', 'secteur'), ('Nom filière', 'nom_filiere'),
+        ('Diplôme préparé', 'diplome_prepare'), ('Cycle', 'cycle'), ('Durée formation (mois)', 'duree_formation'),
+        ('Effectif M', 'effectif_m'), ('Effectif F', 'effectif_f'),
+        ('Stage obligatoire (OUI/NON)', 'stage'), ('Heures pratique/semaine', 'heures_pratique_hebdo'),
+    ]),
+    'formateur': ('Formateurs', lambda: FormateurFormel.objects.order_by('etablissement__code', 'nom_prenom'), [
+        ('Code Établissement', 'etablissement__code'), ('Nom et prénom', 'nom_prenom'), ('Sexe (M/F)', 'sexe'),
+        ('Date naissance', 'date_naissance'), ('Année recrutement', 'annee_recrutement'), ('Statut', 'statut'),
+        ('Nationalité', 'nationalite'), ('Diplôme académique', 'diplome_academique'),
+        ('Diplôme professionnel', 'diplome_professionnel'), ('Disciplines enseignées', 'disciplines_enseignees'),
+        ('Volume horaire/semaine', 'volume_horaire_hebdo'),
+    ]),
+}
+
+
+def lignes_feuille(nom):
+    """En-tête puis lignes d'une feuille, lues par paquets"""
+    _, queryset, colonnes = FEUILLES[nom]
+    yield [entete for entete, _ in colonnes]
+    yield from queryset().values_list(*[champ for _, champ in colonnes]).iterator(chunk_size=CHUNK_SIZE)
+
+
+def pour_csv(lignes):
+    """Dates au format des modèles d'import (JJ/MM/AAAA)"""
+    for ligne in lignes:
+        yield [v.strftime('%d/%m/%Y') if isinstance(v, datetime.date) else v for v in ligne]
+
+
+def flux_zip(noms):
+    """Archive ZIP (un CSV par feuille) produite au fur et à mesure de la lecture"""
+    tampon = TamponZip()
+    with zipfile.ZipFile(tampon, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for nom in noms:
+            with archive.open(f'{nom}s.csv', 'w', force_zip64=True) as fichier:
+                texte = io.TextIOWrapper(fichier, encoding='utf-8', newline='')
+                writer = csv.writer(texte)
+                for numero, ligne in enumerate(pour_csv(lignes_feuille(nom)), 1):
+                    writer.writerow(ligne)
+                    if numero % CHUNK_SIZE == 0:
+                        texte.flush()
+                        yield tampon.vider()
+                texte.flush()
+                texte.detach()
+            yield tampon.vider()
+    yield tampon.vider()
+
+
+def export_registre(modele, format_export):
+    """Réponse d'export : un modèle ('etablissement', ...) ou 'all' pour le registre complet"""
+    noms = list(FEUILLES) if modele == 'all' else [modele]
+    nom_fichier = 'eftp_formel' if modele == 'all' else f'eftp_formel_{modele}s'
+    if format_export != 'csv':
+        return reponse_xlsx([(FEUILLES[nom][0], lignes_feuille(nom)) for nom in noms], f'{nom_fichier}.xlsx')
+    if len(noms) == 1:
+        return reponse_csv(pour_csv(lignes_feuille(modele)), f'{nom_fichier}.csv')
+    response = StreamingHttpResponse(flux_zip(noms), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}.zip"'
+    return response
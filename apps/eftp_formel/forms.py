@@ -100,8 +100,48 @@ class ApprenantFormelForm(forms.ModelForm):
         if redoublants_f > feminin:
             raise forms.ValidationError("Les redoublants féminins ne peuvent pas dépasser l'effectif féminin")
         
+        # En modification : une seule ligne par cycle et année d'étude
+        if self.instance.etablissement_id and ApprenantFormel.objects.filter(
+            etablissement_id=self.instance.etablissement_id,
+            cycle=cleaned_data.get('cycle'), annee_etude=cleaned_data.get('annee_etude'),
+        ).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError("Une ligne existe déjà pour ce cycle et cette année d'étude")
+        
         return cleaned_data
 
+class ApprenantGrilleForm(forms.Form):
+    """Une case de la grille cycle × année d'étude"""
+    cycle = forms.ChoiceField(choices=ApprenantFormel.CYCLE_CHOICES, widget=forms.HiddenInput)
+    annee_etude = forms.ChoiceField(choices=ApprenantFormel.ANNEE_ETUDE_CHOICES, widget=forms.HiddenInput)
+    masculin = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0}))
+    feminin = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0}))
+    redoublants_m = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0}))
+    redoublants_f = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm', 'min': 0}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('redoublants_m', 0) > cleaned_data.get('masculin', 0):
+            raise forms.ValidationError("Les redoublants masculins ne peuvent pas dépasser l'effectif masculin")
+        if cleaned_data.get('redoublants_f', 0) > cleaned_data.get('feminin', 0):
+            raise forms.ValidationError("Les redoublants féminins ne peuvent pas dépasser l'effectif féminin")
+        return cleaned_data
+
+
+class BaseApprenantGrilleFormSet(forms.BaseFormSet):
+    def clean(self):
+        super().clean()
+        cases = [(form.cleaned_data.get('cycle'), form.cleaned_data.get('annee_etude')) for form in self.forms]
+        if len(set(cases)) != len(cases):
+            raise forms.ValidationError("Chaque case cycle / année d'étude ne peut apparaître qu'une fois")
+
+
+# Grille complète : une ligne par couple (cycle, année d'étude), ni ajout ni suppression
+ApprenantGrilleFormSet = forms.formset_factory(
+    ApprenantGrilleForm, formset=BaseApprenantGrilleFormSet, extra=0,
+    max_num=len(ApprenantFormel.CYCLE_CHOICES) * len(ApprenantFormel.ANNEE_ETUDE_CHOICES),
+    validate_max=True,
+)
+
 class FormateurFormelForm(forms.ModelForm):
     class Meta:
         model = FormateurFormel
@@ -0,0 +1,454 @@
+"""
+Import en masse des données EFTP formel depuis un classeur (modèles de generate_templates.py)
+Le fichier est validé colonne par colonne avec pandas, les localités sont résolues
+à partir de dictionnaires en mémoire et l'écriture se fait par lots
+(bulk_create / bulk_update). Les lignes invalides sont écartées, décrites
+dans un rapport ligne par ligne et restituées dans un fichier de rejets.
+"""
+
+import io
+from decimal import Decimal
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+from apps.renaloc.models import Region, Departement, Commune, QuartierVillage
+from apps.renaloc.references import correspondances
+from .models import EtablissementFormel, FormateurFormel
+from . import cache as formel_cache
+
+BATCH_SIZE = 500
+
+# Première ligne de données d'un classeur (ligne 1 = en-têtes)
+PREMIERE_LIGNE = 2
+
+
+def normaliser_serie(serie):
+    """Minuscules, sans accents ni espaces superflus (comme normaliser_recherche, en vectorisé)"""
+    return (
+        serie.fillna('').astype(str)
+        .str.normalize('NFKD').str.replace('[\u0300-\u036f]', '', regex=True)
+        .str.lower().str.replace(r'\s+', ' ', regex=True).str.strip()
+    )
+
+
+def normaliser_entete(entete):
+    """En-tête du modèle ('Région*', "Type d'établissement*") -> clé de COLONNES"""
+    return normaliser_serie(pd.Series([str(entete).replace('*', '')]))[0]
+
+
+def lire_tableau(fichier):
+    """Lit un fichier Excel ou CSV en texte (codes '01' conservés), cellules vides -> ''"""
+    nom = getattr(fichier, 'name', str(fichier)).lower()
+    try:
+        if nom.endswith('.csv'):
+            if hasattr(fichier, 'read'):
+                # Fichier envoyé (binaire) : le détecteur de séparateur attend du texte
+                contenu = fichier.read()
+                fichier = io.StringIO(contenu.decode('utf-8-sig') if isinstance(contenu, bytes) else contenu)
+            df = pd.read_csv(fichier, dtype=str, sep=None, engine='python', encoding='utf-8-sig')
+        else:
+            df = pd.read_excel(fichier, dtype=str)
+    except Exception as e:
+        raise ValueError(f"Fichier illisible : {e}")
+    return df.fillna('').apply(lambda colonne: colonne.str.strip())
+
+
+def valeurs_choix(choices):
+    """Valeur ou libellé normalisé -> valeur enregistrée ('prive', 'privé' -> 'PRIVE')"""
+    correspondance = {}
+    for valeur, libelle in choices:
+        for texte in (valeur, libelle):
+            correspondance[normaliser_entete(texte)] = valeur
+    return correspondance
+
+
+# Cases à cocher : texte normalisé -> booléen
+VALEURS_OUI_NON = {'oui': True, 'o': True, 'vrai': True, '1': True, 'x': True,
+                   'non': False, 'n': False, 'faux': False, '0': False}
+
+
+def en_python(valeur):
+    """Valeur pandas -> valeur Python (NaN / NaT -> None)"""
+    if valeur is None or (not isinstance(valeur, str) and pd.isna(valeur)):
+        return None
+    return valeur
+
+
+class ImportTableau:
+    """
+    Base des imports : renommage des colonnes, validations vectorisées
+    et rapport d'erreurs {index: [messages]}
+    """
+
+    # En-tête normalisé -> champ
+    COLONNES = {}
+    # Champ -> libellé de la colonne (messages d'erreur)
+    LIBELLES = {}
+    OBLIGATOIRES = []
+    # Colonne qui identifie une ligne dans le rapport
+    COLONNE_RAPPORT = 'code'
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.erreurs = {}
+        self.stats = {'crees': 0, 'modifies': 0, 'inchanges': 0, 'rejetes': 0}
+        self.source = None
+
+    def executer(self, fichier):
+        """Valide puis écrit le fichier ; renvoie le rapport d'erreurs"""
+        self.source = lire_tableau(fichier)
+        brut = self.preparer(self.source)
+        df = brut.copy()
+        self.valider(df)
+        valides = df.drop(index=list(self.erreurs))
+        self.stats['rejetes'] = len(self.erreurs)
+        self.ecrire(valides)
+        return self.rapport(brut)
+
+    def valider(self, df):
+        raise NotImplementedError
+
+    def ecrire(self, df):
+        raise NotImplementedError
+
+    def preparer(self, df):
+        """Renomme les colonnes connues, vérifie les colonnes obligatoires, écarte les lignes vides"""
+        colonnes = {}
+        for entete in df.columns:
+            champ = self.COLONNES.get(normaliser_entete(entete))
+            if champ and champ not in colonnes.values():
+                colonnes[entete] = champ
+        df = df[list(colonnes)].rename(columns=colonnes)
+        manquantes = [self.LIBELLES[champ] for champ in self.OBLIGATOIRES if champ not in df.columns]
+        if manquantes:
+            raise ValueError(f"Colonnes obligatoires absentes : {', '.join(manquantes)}")
+        # Lignes vides, et notes du modèle (INSTRUCTIONS...) qui n'occupent que la première colonne
+        remplies = df.ne('')
+        df = df[remplies.any(axis=1) & ~(remplies.iloc[:, 0] & ~remplies.iloc[:, 1:].any(axis=1))]
+        return df
+
+    def signaler(self, masque, message):
+        """Ajoute `message` aux lignes sélectionnées par le masque booléen"""
+        for index in masque.index[masque.fillna(False).astype(bool)]:
+            self.erreurs.setdefault(index, []).append(message)
+
+    def verifier_obligatoires(self, df):
+        for champ in self.OBLIGATOIRES:
+            self.signaler(df[champ].eq(''), f"{self.LIBELLES[champ]} manquant")
+
+    def verifier_longueurs(self, df, model):
+        for champ in df.columns:
+            field = model._meta.get_field(champ)
+            # Les champs à choix sont contrôlés par convertir_choix (libellés acceptés)
+            max_length = None if field.choices else getattr(field, 'max_length', None)
+            if max_length:
+                self.signaler(df[champ].str.len().gt(max_length),
+                              f"{self.LIBELLES[champ]} trop long ({max_length} caractères maximum)")
+
+    def convertir_choix(self, df, champ, choices):
+        if champ not in df.columns:
+            return
+        convertis = normaliser_serie(df[champ]).map(valeurs_choix(choices))
+        possibles = ', '.join(valeur for valeur, _ in choices)
+        self.signaler(df[champ].ne('') & convertis.isna(),
+                      f"{self.LIBELLES[champ]} invalide (valeurs possibles : {possibles})")
+        df[champ] = convertis
+
+    def convertir_entiers(self, df, champ, minimum=0, maximum=None):
+        if champ not in df.columns:
+            return
+        nombres = pd.to_numeric(df[champ].str.replace(',', '.'), errors='coerce')
+        hors_limites = nombres.isna() | nombres.ne(nombres.round()) | nombres.lt(minimum)
+        if maximum is not None:
+            hors_limites |= nombres.gt(maximum)
+        limites = f"entre {minimum} et {maximum}" if maximum is not None else f"supérieur ou égal à {minimum}"
+        self.signaler(df[champ].ne('') & hors_limites, f"{self.LIBELLES[champ]} invalide (nombre entier {limites})")
+        df[champ] = nombres.round().astype('Int64')
+
+    def convertir_booleens(self, df, champ):
+        if champ not in df.columns:
+            return
+        convertis = normaliser_serie(df[champ]).map(VALEURS_OUI_NON)
+        self.signaler(df[champ].ne('') & convertis.isna(), f"{self.LIBELLES[champ]} invalide (OUI/NON)")
+        df[champ] = convertis.fillna(False).astype(bool)
+
+    def convertir_dates(self, df, champ):
+        if champ not in df.columns:
+            return
+        dates = pd.to_datetime(df[champ], dayfirst=True, errors='coerce', format='mixed')
+        self.signaler(df[champ].ne('') & dates.isna(), f"{self.LIBELLES[champ]} : date invalide (JJ/MM/AAAA)")
+        df[champ] = dates.dt.date
+
+    def rapport(self, df):
+        """Erreurs triées par ligne du fichier : [{'ligne', 'code', 'erreurs'}]"""
+        lignes = []
+        for index, messages in sorted(self.erreurs.items()):
+            lignes.append({
+                'ligne': index + PREMIERE_LIGNE,
+                'code': df.at[index, self.COLONNE_RAPPORT] if self.COLONNE_RAPPORT in df.columns else '',
+                'erreurs': '; '.join(messages),
+            })
+        return lignes
+
+    def fichier_rejets(self):
+        """CSV des lignes rejetées, colonnes d'origine + 'Erreurs', à corriger puis réimporter"""
+        if not self.erreurs:
+            return None
+        index = sorted(self.erreurs)
+        rejets = self.source.loc[index].copy()
+        rejets['Erreurs'] = ['; '.join(self.erreurs[i]) for i in index]
+        return rejets.to_csv(index=False).encode('utf-8-sig')
+
+
+class ImportEtablissements(ImportTableau):
+    """Import des établissements (modèle etablissement_template.xlsx), upsert sur le code"""
+
+    COLONNES = {
+        'code': 'code', 'nom': 'nom', 'sigle': 'sigle', 'statut': 'statut', 'zone': 'zone',
+        'region': 'region', 'departement': 'departement', 'commune': 'commune',
+        'quartier/village': 'quartier_village', 'quartier': 'quartier_village', 'village': 'quartier_village',
+        "type d'etablissement": 'type_etablissement', 'type': 'type_etablissement',
+        'regime': 'regime', 'date autorisation': 'date_autorisation',
+        "date d'autorisation": 'date_autorisation', "date d'ouverture": 'date_ouverture',
+        'date ouverture': 'date_ouverture', 'adresse': 'adresse',
+        'longitude': 'longitude', 'latitude': 'latitude',
+    }
+    LIBELLES = {
+        'code': 'Code', 'nom': 'Nom', 'sigle': 'Sigle', 'statut': 'Statut', 'zone': 'Zone',
+        'region': 'Région', 'departement': 'Département', 'commune': 'Commune',
+        'quartier_village': 'Quartier/Village', 'type_etablissement': "Type d'établissement",
+        'regime': 'Régime', 'date_autorisation': 'Date autorisation', 'date_ouverture': "Date d'ouverture",
+        'adresse': 'Adresse', 'longitude': 'Longitude', 'latitude': 'Latitude',
+    }
+    OBLIGATOIRES = ['code', 'nom', 'statut', 'zone', 'region', 'departement', 'commune',
+                    'type_etablissement', 'regime']
+    LIMITES_COORDONNEES = {'longitude': 180, 'latitude': 90}
+
+    def valider(self, df):
+        """Toutes les vérifications, colonne par colonne"""
+        self.verifier_obligatoires(df)
+        self.verifier_longueurs(df, EtablissementFormel)
+        self.signaler(df['code'].ne('') & df['code'].duplicated(keep='first'), "Code en double dans le fichier")
+        self.convertir_choix(df, 'statut', EtablissementFormel.STATUT_CHOICES)
+        self.convertir_choix(df, 'zone', EtablissementFormel.ZONE_CHOICES)
+        self.convertir_choix(df, 'type_etablissement', EtablissementFormel.TYPE_ETABLISSEMENT_CHOICES)
+        self.convertir_choix(df, 'regime', EtablissementFormel.REGIME_CHOICES)
+        self.convertir_dates(df, 'date_autorisation')
+        self.convertir_dates(df, 'date_ouverture')
+        for champ, limite in self.LIMITES_COORDONNEES.items():
+            if champ in df.columns:
+                nombres = pd.to_numeric(df[champ].str.replace(',', '.'), errors='coerce')
+                self.signaler(df[champ].ne('') & (nombres.isna() | nombres.abs().gt(limite)),
+                              f"{self.LIBELLES[champ]} invalide (nombre entre -{limite} et {limite})")
+                df[champ] = nombres.round(6)
+        self.resoudre_localites(df)
+
+    def resoudre_localites(self, df):
+        """
+        Région, département, commune (et quartier) donnés par code ou par nom :
+        codes -> id depuis les correspondances en mémoire, noms cherchés dans le parent
+        """
+        niveaux = [('region', Region, None), ('departement', Departement, 'region'), ('commune', Commune, 'departement')]
+        if 'quartier_village' in df.columns:
+            niveaux.append(('quartier_village', QuartierVillage, 'commune'))
+
+        for champ, model, parent in niveaux:
+            modele = model._meta.model_name
+            valeurs = df[champ]
+            ids = valeurs.map(correspondances.codes(modele))
+            noms = normaliser_serie(valeurs)
+            if parent is None:
+                par_nom = dict(model.objects.values_list('nom_recherche', 'id'))
+                ids = ids.fillna(noms.map(par_nom))
+            else:
+                ids_parents = df[f'{parent}_id']
+                lignes = model.objects.values_list(f'{parent}_id', 'nom_recherche', 'id')
+                if model is QuartierVillage:
+                    lignes = lignes.filter(commune_id__in=set(ids_parents.dropna()))
+                # Les noms ne sont uniques qu'à l'intérieur du parent
+                par_nom = {f'{parent_id}|{nom}': pk for parent_id, nom, pk in lignes}
+                cles = ids_parents.astype('Int64').astype(str) + '|' + noms
+                ids = ids.fillna(cles.map(par_nom))
+                # Un code valide doit aussi appartenir au parent indiqué
+                parents = ids.map(correspondances.parents(modele))
+                self.signaler(ids.notna() & ids_parents.notna() & parents.ne(ids_parents),
+                              f"{self.LIBELLES[champ]} incohérent avec : {self.LIBELLES[parent]}")
+            self.signaler(valeurs.ne('') & ids.isna(), f"{self.LIBELLES[champ]} introuvable")
+            df[f'{champ}_id'] = ids.astype('Int64')
+
+    def champs_ecrits(self, df):
+        """Champs du modèle alimentés par le fichier (les colonnes absentes ne sont pas touchées)"""
+        champs = []
+        for champ in self.LIBELLES:
+            if champ == 'code' or champ not in df.columns:
+                continue
+            if champ in ('region', 'departement', 'commune', 'quartier_village'):
+                champs.append(f'{champ}_id')
+            else:
+                champs.append(champ)
+        return champs
+
+    def valeurs(self, ligne, champs):
+        valeurs = {}
+        for champ in champs:
+            valeur = en_python(ligne[champ])
+            if champ in self.LIMITES_COORDONNEES and valeur is not None:
+                valeur = Decimal(str(valeur)).quantize(Decimal('0.000001'))
+            elif champ.endswith('_id') and valeur is not None:
+                valeur = int(valeur)
+            valeurs[champ] = '' if valeur is None and champ in ('sigle', 'adresse') else valeur
+        return valeurs
+
+    def ecrire(self, df):
+        """Upsert sur le code : bulk_create des nouveaux, bulk_update des modifiés"""
+        if df.empty:
+            return
+        champs = self.champs_ecrits(df)
+        existants = dict(EtablissementFormel.objects.values_list('code', 'pk'))
+        maintenant = timezone.now()
+        with transaction.atomic():
+            for debut in range(0, len(df), self.batch_size):
+                lot = df.iloc[debut:debut + self.batch_size]
+                codes_existants = [code for code in lot['code'] if code in existants]
+                objets = EtablissementFormel.objects.in_bulk(codes_existants, field_name='code')
+                a_creer, a_modifier = [], []
+                for ligne in lot.to_dict('records'):
+                    valeurs = self.valeurs(ligne, champs)
+                    obj = objets.get(ligne['code'])
+                    if obj is None:
+                        obj = EtablissementFormel(code=ligne['code'], **valeurs)
+                        obj.taux_completion = obj.get_completion_percentage()
+                        a_creer.append(obj)
+                    elif any(getattr(obj, champ) != valeur for champ, valeur in valeurs.items()):
+                        for champ, valeur in valeurs.items():
+                            setattr(obj, champ, valeur)
+                        obj.taux_completion = obj.get_completion_percentage()
+                        obj.updated_at = maintenant
+                        a_modifier.append(obj)
+                    else:
+                        self.stats['inchanges'] += 1
+                EtablissementFormel.objects.bulk_create(a_creer)
+                EtablissementFormel.objects.bulk_update(a_modifier, champs + ['taux_completion', 'updated_at'])
+                self.stats['crees'] += len(a_creer)
+                self.stats['modifies'] += len(a_modifier)
+        if self.stats['crees'] or self.stats['modifies']:
+            # bulk_create / bulk_update n'émettent pas de signaux
+            formel_cache.invalider('etablissementformel')
+
+
+class ImportFormateurs(ImportTableau):
+    """
+    Import des formateurs (modèle formateur_template.xlsx). Un formateur déjà
+    enregistré est reconnu par son nom normalisé et sa date de naissance :
+    sa fiche est mise à jour (y compris son établissement) au lieu d'être dupliquée.
+    """
+
+    COLONNES = {
+        'code etablissement': 'etablissement', 'etablissement': 'etablissement',
+        'nom et prenom': 'nom_prenom', 'nom prenom': 'nom_prenom', 'nom': 'nom_prenom',
+        'sexe (m/f)': 'sexe', 'sexe': 'sexe',
+        'date naissance': 'date_naissance', 'date de naissance': 'date_naissance',
+        'annee recrutement': 'annee_recrutement', 'annee de recrutement': 'annee_recrutement',
+        'statut': 'statut', 'nationalite': 'nationalite',
+        'diplome academique': 'diplome_academique', 'diplome professionnel': 'diplome_professionnel',
+        'disciplines enseignees': 'disciplines_enseignees', 'disciplines': 'disciplines_enseignees',
+        'volume horaire/semaine': 'volume_horaire_hebdo', 'volume horaire hebdomadaire': 'volume_horaire_hebdo',
+        'renforcement (oui/non)': 'a_recu_renforcement', 'a recu un renforcement': 'a_recu_renforcement',
+        'inspecte (oui/non)': 'a_ete_inspecte', 'a ete inspecte': 'a_ete_inspecte',
+    }
+    LIBELLES = {
+        'etablissement': 'Code Établissement', 'nom_prenom': 'Nom et prénom', 'sexe': 'Sexe',
+        'date_naissance': 'Date naissance', 'annee_recrutement': 'Année recrutement', 'statut': 'Statut',
+        'nationalite': 'Nationalité', 'diplome_academique': 'Diplôme académique',
+        'diplome_professionnel': 'Diplôme professionnel', 'disciplines_enseignees': 'Disciplines enseignées',
+        'volume_horaire_hebdo': 'Volume horaire/semaine', 'a_recu_renforcement': 'Renforcement',
+        'a_ete_inspecte': 'Inspecté',
+    }
+    OBLIGATOIRES = ['etablissement', 'nom_prenom', 'sexe', 'date_naissance', 'annee_recrutement',
+                    'statut', 'nationalite', 'disciplines_enseignees', 'volume_horaire_hebdo']
+    COLONNE_RAPPORT = 'nom_prenom'
+
+    @staticmethod
+    def cle(noms, dates):
+        """Clé de reconnaissance d'un formateur : 'nom normalisé|AAAA-MM-JJ'"""
+        return normaliser_serie(noms) + '|' + pd.Series(dates, index=noms.index).astype(str)
+
+    def valider(self, df):
+        self.verifier_obligatoires(df)
+        self.verifier_longueurs(df, FormateurFormel)
+        self.convertir_choix(df, 'sexe', FormateurFormel._meta.get_field('sexe').choices)
+        self.convertir_choix(df, 'statut', FormateurFormel.STATUT_CHOICES)
+        self.convertir_choix(df, 'nationalite', FormateurFormel.NATIONALITE_CHOICES)
+        self.convertir_dates(df, 'date_naissance')
+        self.convertir_entiers(df, 'annee_recrutement', 1900, timezone.now().year)
+        self.convertir_entiers(df, 'volume_horaire_hebdo', 0, 168)
+        self.convertir_booleens(df, 'a_recu_renforcement')
+        self.convertir_booleens(df, 'a_ete_inspecte')
+
+        codes = set(df['etablissement']) - {''}
+        etablissements = dict(EtablissementFormel.objects.filter(code__in=codes).values_list('code', 'pk'))
+        df['etablissement_id'] = df['etablissement'].map(etablissements).astype('Int64')
+        self.signaler(df['etablissement'].ne('') & df['etablissement_id'].isna(), "Établissement introuvable")
+
+        df['cle'] = self.cle(df['nom_prenom'], df['date_naissance'])
+        self.signaler(df['nom_prenom'].ne('') & df['date_naissance'].notna() & df['cle'].duplicated(keep='first'),
+                      "Formateur en double dans le fichier (même nom et date de naissance)")
+
+    def champs_ecrits(self, df):
+        """Champs du modèle alimentés par le fichier (les colonnes absentes ne sont pas touchées)"""
+        return ['etablissement_id' if champ == 'etablissement' else champ
+                for champ in self.LIBELLES if champ in df.columns]
+
+    def existants(self, df):
+        """Clé -> formateur déjà enregistré, pour les dates de naissance du fichier"""
+        lignes = pd.DataFrame.from_records(
+            FormateurFormel.objects.filter(date_naissance__in=set(df['date_naissance']))
+            .order_by('pk').values_list('pk', 'nom_prenom', 'date_naissance'),
+            columns=['pk', 'nom_prenom', 'date_naissance'],
+        )
+        if lignes.empty:
+            return {}
+        lignes['cle'] = self.cle(lignes['nom_prenom'], lignes['date_naissance'])
+        # Doublons déjà en base : la fiche la plus ancienne est mise à jour
+        return dict(lignes.drop_duplicates('cle').set_index('cle')['pk'])
+
+    def ecrire(self, df):
+        """Upsert sur (nom normalisé, date de naissance), par lots"""
+        if df.empty:
+            return
+        champs = self.champs_ecrits(df)
+        existants = self.existants(df)
+        touches = set()
+        with transaction.atomic():
+            for debut in range(0, len(df), self.batch_size):
+                lot = df.iloc[debut:debut + self.batch_size]
+                objets = FormateurFormel.objects.in_bulk([existants[cle] for cle in lot['cle'] if cle in existants])
+                a_creer, a_modifier = [], []
+                for ligne in lot.to_dict('records'):
+                    valeurs = {champ: en_python(ligne[champ]) for champ in champs}
+                    valeurs['etablissement_id'] = int(valeurs['etablissement_id'])
+                    for champ in ('annee_recrutement', 'volume_horaire_hebdo'):
+                        valeurs[champ] = int(valeurs[champ])
+                    for champ in ('diplome_academique', 'diplome_professionnel'):
+                        if champ in valeurs and valeurs[champ] is None:
+                            valeurs[champ] = ''
+                    obj = objets.get(existants.get(ligne['cle']))
+                    if obj is None:
+                        a_creer.append(FormateurFormel(**valeurs))
+                    elif any(getattr(obj, champ) != valeur for champ, valeur in valeurs.items()):
+                        # Ancien et nouvel établissement en cas de mutation
+                        touches.add(obj.etablissement_id)
+                        for champ, valeur in valeurs.items():
+                            setattr(obj, champ, valeur)
+                        a_modifier.append(obj)
+                    else:
+                        self.stats['inchanges'] += 1
+                        continue
+                    touches.add(valeurs['etablissement_id'])
+                FormateurFormel.objects.bulk_create(a_creer)
+                FormateurFormel.objects.bulk_update(a_modifier, champs)
+                self.stats['crees'] += len(a_creer)
+                self.stats['modifies'] += len(a_modifier)
+        if self.stats['crees'] or self.stats['modifies']:
+            # bulk_create / bulk_update n'émettent pas de signaux
+            formel_cache.invalider('formateurformel', *(f'etablissement:{pk}' for pk in touches))
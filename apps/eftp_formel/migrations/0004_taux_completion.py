@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:04
+
+from django.db import migrations, models
+from apps.core.completion import expression_completion
+
+# CHAMPS_COMPLETION du modèle à la date de la migration (le modèle historique ne le porte pas)
+CHAMPS_COMPLETION = [
+    'nom', 'code', 'statut', 'zone', 'region', 'departement', 'commune',
+    'type_etablissement', 'regime', 'date_autorisation', 'date_ouverture',
+    'dre', 'ipde', 'longitude', 'latitude', 'patrimoine_foncier',
+    'ministere_tutelle', 'type_formation',
+    'cycle_base_1', 'cycle_base_2', 'cycle_moyen_1', 'cycle_moyen_2',
+]
+
+
+def calculer_taux(apps, schema_editor):
+    """Même UPDATE que la commande recalculer_completion, sur le modèle historique"""
+    model = apps.get_model('eftp_formel', 'EtablissementFormel')
+    expression = expression_completion(model, CHAMPS_COMPLETION)
+    model.objects.exclude(taux_completion=expression).update(taux_completion=expression)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eftp_formel', '0003_alter_etablissementformel_sigle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='etablissementformel',
+            name='taux_completion',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False, verbose_name='Complétude (%)'),
+        ),
+        migrations.RunPython(calculer_taux, migrations.RunPython.noop),
+    ]
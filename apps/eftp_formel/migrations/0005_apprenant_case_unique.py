@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Subquery, Sum
+
+CHAMPS_EFFECTIFS = ['masculin', 'feminin', 'redoublants_m', 'redoublants_f']
+
+
+def fusionner_doublons(apps, schema_editor):
+    """Fusionne les cases en double dans la ligne la plus ancienne (effectifs additionnés)
+    avant de poser la contrainte ; ensuite, ApprenantQuerySet.cumuler empêche les doublons"""
+    ApprenantFormel = apps.get_model('eftp_formel', 'ApprenantFormel')
+    cle = ['etablissement', 'cycle', 'annee_etude']
+    groupes = (
+        ApprenantFormel.objects.order_by().values(*cle)
+        .annotate(nb=Count('id'), garde=Min('id'), **{f'total_{champ}': Sum(champ) for champ in CHAMPS_EFFECTIFS})
+        .filter(nb__gt=1)
+    )
+    ApprenantFormel.objects.bulk_update([
+        ApprenantFormel(pk=groupe['garde'], **{champ: groupe[f'total_{champ}'] for champ in CHAMPS_EFFECTIFS})
+        for groupe in groupes
+    ], CHAMPS_EFFECTIFS, batch_size=500)
+    gardes = ApprenantFormel.objects.order_by().values(*cle).annotate(garde=Min('id')).values('garde')
+    ApprenantFormel.objects.exclude(pk__in=Subquery(gardes)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eftp_formel', '0004_taux_completion'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionner_doublons, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='apprenantformel',
+            constraint=models.UniqueConstraint(fields=('etablissement', 'cycle', 'annee_etude'), name='apprenant_case_unique'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renaloc', '0006_journalmodification'),
+        ('eftp_formel', '0005_apprenant_case_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='etablissementformel',
+            name='departement',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='renaloc.departement', verbose_name='Département'),
+        ),
+        migrations.AlterField(
+            model_name='etablissementformel',
+            name='region',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='renaloc.region', verbose_name='Région'),
+        ),
+        migrations.AddIndex(
+            model_name='etablissementformel',
+            index=models.Index(fields=['statut', 'zone', 'code'], name='etab_statut_zone_code'),
+        ),
+        migrations.AddIndex(
+            model_name='etablissementformel',
+            index=models.Index(fields=['zone', 'type_etablissement', 'code'], name='etab_zone_type_code'),
+        ),
+        migrations.AddIndex(
+            model_name='etablissementformel',
+            index=models.Index(fields=['type_etablissement', 'statut', 'code'], name='etab_type_statut_code'),
+        ),
+        migrations.AddIndex(
+            model_name='etablissementformel',
+            index=models.Index(fields=['region', 'statut', 'code'], name='etab_region_statut_code'),
+        ),
+        migrations.AddIndex(
+            model_name='etablissementformel',
+            index=models.Index(fields=['departement', 'statut', 'code'], name='etab_dept_statut_code'),
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from apps.renaloc.models import Region, Departement, Commune, QuartierVillage
+from apps.core.completion import CompletionQuerySet
+from . import cache as formel_cache
 
-from django.db import models
-from apps.renaloc.models import Region, Departement, Commune, QuartierVillage
+# Taux de complétude à partir duquel un établissement est considéré complet
+SEUIL_COMPLETION = 80
 
 class EtablissementFormel(models.Model):
     # Identification
@@ -24,8 +27,9 @@ class EtablissementFormel(models.Model):
     zone = models.CharField(max_length=20, choices=ZONE_CHOICES, verbose_name="Zone")
     
     # Localisation administrative
-    region = models.ForeignKey(Region, on_delete=models.PROTECT, verbose_name="Région")
-    departement = models.ForeignKey(Departement, on_delete=models.PROTECT, verbose_name="Département")
+    # region et departement : index composites (Meta.indexes) à la place de l'index simple
+    region = models.ForeignKey(Region, on_delete=models.PROTECT, db_index=False, verbose_name="Région")
+    departement = models.ForeignKey(Departement, on_delete=models.PROTECT, db_index=False, verbose_name="Département")
     commune = models.ForeignKey(Commune, on_delete=models.PROTECT, verbose_name="Commune")
     quartier_village = models.ForeignKey(QuartierVillage, on_delete=models.PROTECT, null=True, blank=True, 
                                         verbose_name="Quartier/Village")
@@ -89,48 +93,94 @@ class EtablissementFormel(models.Model):
     type_formation = models.CharField(max_length=50, blank=True, verbose_name="Type de formation")
     dispositif_orientation = models.BooleanField(default=False, verbose_name="Dispositif d'orientation")
     
+    # Complétude enregistrée (recalculée à chaque save) pour filtrer et trier en SQL
+    taux_completion = models.PositiveSmallIntegerField(default=0, editable=False, db_index=True,
+                                                      verbose_name="Complétude (%)")
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de modification")
     
+    objects = CompletionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['code']
         verbose_name = "Établissement formel"
         verbose_name_plural = "Établissements formels"
+        # Combinaisons de filtres de la liste et de l'admin, triées par code
+        # (vérifié par PlansFiltresEtablissementsTest dans tests.py)
+        indexes = [
+            models.Index(fields=['statut', 'zone', 'code'], name='etab_statut_zone_code'),
+            models.Index(fields=['zone', 'type_etablissement', 'code'], name='etab_zone_type_code'),
+            models.Index(fields=['type_etablissement', 'statut', 'code'], name='etab_type_statut_code'),
+            models.Index(fields=['region', 'statut', 'code'], name='etab_region_statut_code'),
+            models.Index(fields=['departement', 'statut', 'code'], name='etab_dept_statut_code'),
+        ]
     
     def __str__(self):
         if self.sigle:
             return f"{self.sigle} - {self.nom}"
         return f"{self.nom}"
 
+    # Champs importants puis cycles, pris en compte par le taux de complétude
+    CHAMPS_COMPLETION = [
+        'nom', 'code', 'statut', 'zone', 'region', 'departement', 'commune',
+        'type_etablissement', 'regime', 'date_autorisation', 'date_ouverture',
+        'dre', 'ipde', 'longitude', 'latitude', 'patrimoine_foncier',
+        'ministere_tutelle', 'type_formation',
+        'cycle_base_1', 'cycle_base_2', 'cycle_moyen_1', 'cycle_moyen_2',
+    ]
+
     def get_completion_percentage(self):
-        """Calcule le pourcentage de complétude de l'établissement"""
-        # Liste des champs importants à vérifier
-        important_fields = [
-            'nom', 'code', 'statut', 'zone', 'region', 'departement', 'commune',
-            'type_etablissement', 'regime', 'date_autorisation', 'date_ouverture',
-            'dre', 'ipde', 'longitude', 'latitude', 'patrimoine_foncier',
-            'ministere_tutelle', 'type_formation'
-        ]
-        
-        # Compter les champs remplis
+        """
+        Calcule le pourcentage de complétude de l'établissement
+        (même règle en SQL : EtablissementFormel.objects.avec_completion())
+        """
+        # Compter les champs remplis (clés étrangères lues par leur _id, sans requête)
         filled = 0
-        for field in important_fields:
-            value = getattr(self, field)
+        for field in self.CHAMPS_COMPLETION:
+            value = getattr(self, self._meta.get_field(field).attname)
             if value not in [None, '', False]:
                 filled += 1
         
-        # Ajouter les cycles
-        cycles = ['cycle_base_1', 'cycle_base_2', 'cycle_moyen_1', 'cycle_moyen_2']
-        for cycle in cycles:
-            if getattr(self, cycle):
-                filled += 1
-        
-        total_fields = len(important_fields) + len(cycles)
+        total_fields = len(self.CHAMPS_COMPLETION)
         return int((filled / total_fields) * 100) if total_fields > 0 else 0
     
     def has_complete_data(self):
         """Vérifie si l'établissement a des données complètes"""
-        return self.get_completion_percentage() >= 80
+        return self.get_completion_percentage() >= SEUIL_COMPLETION
+    
+    def save(self, *args, **kwargs):
+        self.taux_completion = self.get_completion_percentage()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'taux_completion'}
+        super().save(*args, **kwargs)
+
+class ApprenantQuerySet(models.QuerySet):
+    """Une ligne par case (établissement, cycle, année d'étude)"""
+
+    def cumuler(self, etablissement, cycle, annee_etude, **effectifs):
+        """Ajoute des effectifs à une case, créée si besoin. Retourne True si la case a été créée"""
+        inconnus = set(effectifs) - set(self.model.CHAMPS_EFFECTIFS)
+        if not effectifs or inconnus:
+            raise ValueError(f"Effectifs attendus parmi {', '.join(self.model.CHAMPS_EFFECTIFS)}")
+        etablissement_id = getattr(etablissement, 'pk', etablissement)
+        case = self.filter(etablissement_id=etablissement_id, cycle=cycle, annee_etude=annee_etude)
+        increments = {champ: F(champ) + valeur for champ, valeur in effectifs.items()}
+
+        # Case existante : un seul UPDATE sur l'index unique
+        cree = False
+        if not case.update(**increments):
+            try:
+                with transaction.atomic():
+                    self.create(etablissement_id=etablissement_id, cycle=cycle, annee_etude=annee_etude, **effectifs)
+                cree = True
+            except IntegrityError:
+                # Case créée entre-temps par une autre requête
+                case.update(**increments)
+        # update() n'émet pas de signaux ; invalidation après la validation de l'appelant
+        transaction.on_commit(lambda: formel_cache.invalider('apprenantformel', f'etablissement:{etablissement_id}'))
+        return cree
+
 
 class ApprenantFormel(models.Model):
     etablissement = models.ForeignKey(EtablissementFormel, on_delete=models.CASCADE, related_name='apprenants')
@@ -156,9 +206,17 @@ class ApprenantFormel(models.Model):
     redoublants_m = models.IntegerField(default=0)
     redoublants_f = models.IntegerField(default=0)
     
+    # Effectifs d'une case, additionnés lors des fusions
+    CHAMPS_EFFECTIFS = ['masculin', 'feminin', 'redoublants_m', 'redoublants_f']
+    
+    objects = ApprenantQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Apprenant formel"
         verbose_name_plural = "Apprenants formels"
+        constraints = [
+            models.UniqueConstraint(fields=['etablissement', 'cycle', 'annee_etude'], name='apprenant_case_unique'),
+        ]
 
 class FiliereFormel(models.Model):
     etablissement = models.ForeignKey(EtablissementFormel, on_delete=models.CASCADE, related_name='filieres')
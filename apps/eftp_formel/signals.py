@@ -0,0 +1,24 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from .models import EtablissementFormel, ApprenantFormel, FiliereFormel, FormateurFormel
+from . import cache as formel_cache
+
+
+def invalider_statistiques(sender, instance, **kwargs):
+    """Invalide, après la validation, les statistiques en cache qui dépendent du modèle modifié"""
+    transaction.on_commit(partial(formel_cache.invalider, sender._meta.model_name))
+
+def invalider_statistiques_etablissement(sender, instance, **kwargs):
+    """Invalide, après la validation, les statistiques de l'établissement d'un apprenant, d'une filière ou d'un formateur"""
+    transaction.on_commit(partial(formel_cache.invalider, f'etablissement:{instance.etablissement_id}'))
+
+for model in (EtablissementFormel, ApprenantFormel, FiliereFormel, FormateurFormel):
+    nom = model._meta.model_name
+    post_save.connect(invalider_statistiques, sender=model, dispatch_uid=f'eftp_formel_cache_save_{nom}')
+    post_delete.connect(invalider_statistiques, sender=model, dispatch_uid=f'eftp_formel_cache_delete_{nom}')
+
+for model in (ApprenantFormel, FiliereFormel, FormateurFormel):
+    nom = model._meta.model_name
+    post_save.connect(invalider_statistiques_etablissement, sender=model, dispatch_uid=f'eftp_formel_stats_save_{nom}')
+    post_delete.connect(invalider_statistiques_etablissement, sender=model, dispatch_uid=f'eftp_formel_stats_delete_{nom}')
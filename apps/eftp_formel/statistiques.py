@@ -0,0 +1,80 @@
+"""
+Statistiques agrégées des établissements formels, calculées en SQL et mises en cache
+"""
+
+import hashlib
+from urllib.parse import urlencode
+from django.db.models import Count, Q, Sum
+from .models import ApprenantFormel, FiliereFormel, FormateurFormel
+from . import cache as formel_cache
+
+
+def statistiques_liste(etablissements, filtres):
+    """
+    Bandeau de la liste : total, publics, privés, urbains, ruraux et apprenants par sexe,
+    en une seule requête (COUNT DISTINCT conditionnels + SUM sur la jointure des apprenants),
+    mise en cache par combinaison de filtres
+    """
+    def calcul():
+        stats = etablissements.order_by().aggregate(
+            total=Count('id', distinct=True),
+            publics=Count('id', filter=Q(statut='PUBLIC'), distinct=True),
+            prives=Count('id', filter=Q(statut='PRIVE'), distinct=True),
+            urbains=Count('id', filter=Q(zone='URBAINE'), distinct=True),
+            ruraux=Count('id', filter=Q(zone='RURALE'), distinct=True),
+            apprenants_m=Sum('apprenants__masculin'),
+            apprenants_f=Sum('apprenants__feminin'),
+        )
+        stats['apprenants_m'] = stats['apprenants_m'] or 0
+        stats['apprenants_f'] = stats['apprenants_f'] or 0
+        stats['apprenants'] = stats['apprenants_m'] + stats['apprenants_f']
+        return stats
+
+    empreinte = hashlib.md5(urlencode(sorted(filtres.items())).encode()).hexdigest()
+    return formel_cache.get_or_set(
+        f'statistiques_liste:{empreinte}', ('etablissementformel', 'apprenantformel'), calcul
+    )
+
+
+def statistiques_etablissement(etablissement_id):
+    """
+    Chiffres d'un établissement : un agrégat par table liée (apprenants, formateurs,
+    filières), mis en cache jusqu'à la prochaine modification d'une de ces lignes
+    """
+    def calcul():
+        apprenants = ApprenantFormel.objects.filter(etablissement_id=etablissement_id).aggregate(
+            lignes=Count('id'),
+            masculin=Sum('masculin'),
+            feminin=Sum('feminin'),
+            redoublants_m=Sum('redoublants_m'),
+            redoublants_f=Sum('redoublants_f'),
+        )
+        formateurs = FormateurFormel.objects.filter(etablissement_id=etablissement_id).aggregate(
+            total=Count('id'),
+            masculin=Count('id', filter=Q(sexe='M')),
+            feminin=Count('id', filter=Q(sexe='F')),
+        )
+        filieres = FiliereFormel.objects.filter(etablissement_id=etablissement_id).aggregate(
+            total=Count('id'),
+            effectif_m=Sum('effectif_m'),
+            effectif_f=Sum('effectif_f'),
+        )
+        apprenants_m = apprenants['masculin'] or 0
+        apprenants_f = apprenants['feminin'] or 0
+        return {
+            'lignes_apprenants': apprenants['lignes'],
+            'total_apprenants': apprenants_m + apprenants_f,
+            'apprenants_m': apprenants_m,
+            'apprenants_f': apprenants_f,
+            'redoublants_m': apprenants['redoublants_m'] or 0,
+            'redoublants_f': apprenants['redoublants_f'] or 0,
+            'total_formateurs': formateurs['total'],
+            'formateurs_m': formateurs['masculin'],
+            'formateurs_f': formateurs['feminin'],
+            'total_filieres': filieres['total'],
+            'effectif_filieres_m': filieres['effectif_m'] or 0,
+            'effectif_filieres_f': filieres['effectif_f'] or 0,
+        }
+
+    nom = f'etablissement:{etablissement_id}'
+    return formel_cache.get_or_set(nom, (nom,), calcul)
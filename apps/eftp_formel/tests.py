@@ -0,0 +1,100 @@
+import itertools
+import re
+import unittest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.renaloc.models import Region, Departement, Commune
+from .models import EtablissementFormel
+from .views import NIVEAUX_COMPLETUDE
+
+TABLE_SQL = f'"{EtablissementFormel._meta.db_table}"'
+TABLE = re.escape(EtablissementFormel._meta.db_table)
+RECHERCHE_INDEX = re.compile(rf'\bSEARCH {TABLE} USING (?:COVERING )?INDEX\b')
+PARCOURS = re.compile(rf'\bSCAN {TABLE}\b')
+
+# Filtres de l'admin (list_filter) -> paramètre GET
+FILTRES_ADMIN = {
+    'region': 'region__id__exact', 'type': 'type_etablissement__exact', 'statut': 'statut__exact',
+    'zone': 'zone__exact', 'departement': 'departement__id__exact',
+}
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Plans EXPLAIN QUERY PLAN propres à SQLite")
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PlansFiltresEtablissementsTest(TestCase):
+    """Les requêtes de la liste et de l'admin sont servies par un index pour chaque combinaison de filtres"""
+
+    @classmethod
+    def setUpTestData(cls):
+        region = Region.objects.create(code='01', nom='Agadez')
+        # Deuxième région : l'admin n'applique pas un filtre qui n'a qu'un seul choix
+        Region.objects.create(code='02', nom='Diffa')
+        departements = [
+            Departement.objects.create(code=f'10{rang}', nom=f'Département {rang}', region=region)
+            for rang in (1, 2)
+        ]
+        commune = Commune.objects.create(code='10101', nom='Commune 1', departement=departements[0])
+        combinaisons = itertools.product(('PUBLIC', 'PRIVE'), ('URBAINE', 'RURALE'), ('LP', 'CFPT'), departements)
+        for numero, (statut, zone, type_etablissement, departement) in enumerate(combinaisons):
+            EtablissementFormel.objects.create(
+                code=f'E{numero:04d}', nom=f'Établissement {numero}', statut=statut, zone=zone,
+                type_etablissement=type_etablissement, regime='EXTERNAT',
+                region=region, departement=departement, commune=commune,
+            )
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        cls.valeurs = {
+            'region': str(region.pk), 'type': 'LP', 'statut': 'PUBLIC', 'zone': 'URBAINE',
+            'departement': departements[0].pk,
+        }
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        # Cache local vide : les statistiques de la liste sont recalculées à chaque appel
+        cache.clear()
+
+    def combinaisons(self, noms):
+        """Chaque combinaison non vide de `noms` (completude : chacune des tranches)"""
+        for taille in range(1, len(noms) + 1):
+            for combinaison in itertools.combinations(noms, taille):
+                niveaux = NIVEAUX_COMPLETUDE if 'completude' in combinaison else [None]
+                for niveau in niveaux:
+                    valeurs = {nom: self.valeurs[nom] for nom in combinaison if nom != 'completude'}
+                    if niveau:
+                        valeurs['completude'] = niveau
+                    yield valeurs
+
+    def plans(self, url, params):
+        """Plans des requêtes filtrées sur les établissements exécutées par la vue"""
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url, params)
+        self.assertEqual(reponse.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for requete in requetes:
+                # L'admin compte aussi la table entière (« x sur y ») : seules les requêtes filtrées comptent
+                if TABLE_SQL not in requete['sql'] or ' WHERE ' not in requete['sql']:
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {requete['sql']}")
+                plans.append((requete['sql'], '\n'.join(ligne[-1] for ligne in cursor.fetchall())))
+        self.assertTrue(plans)
+        return plans
+
+    def verifier(self, url, params):
+        for sql, plan in self.plans(url, params):
+            with self.subTest(filtres=params, sql=sql, plan=plan):
+                self.assertRegex(plan, RECHERCHE_INDEX)
+                self.assertNotRegex(plan, PARCOURS)
+
+    def test_liste_utilise_un_index(self):
+        for valeurs in self.combinaisons(['region', 'type', 'statut', 'zone', 'completude']):
+            self.verifier(reverse('eftp_formel:etablissement_list'), valeurs)
+
+    def test_admin_utilise_un_index(self):
+        for valeurs in self.combinaisons(['region', 'type', 'statut', 'zone', 'departement']):
+            params = {FILTRES_ADMIN[nom]: valeur for nom, valeur in valeurs.items()}
+            self.verifier(reverse('admin:eftp_formel_etablissementformel_changelist'), params)
@@ -15,10 +15,12 @@ urlpatterns = [
     # Import/Export
     path('import-export/', views.import_export, name='import_export'),
     path('import-data/', views.import_data, name='import_data'),
+    path('import-data/rejets/<str:jeton>/', views.import_rejets, name='import_rejets'),
     path('export-data/', views.export_data, name='export_data'),
     
     # Apprenants
     path('apprenants/create/<int:etablissement_id>/', views.apprenant_create, name='apprenant_create'),
+    path('apprenants/grille/<int:etablissement_id>/', views.apprenant_grille, name='apprenant_grille'),
     path('apprenants/<int:pk>/edit/', views.apprenant_edit, name='apprenant_edit'),
     path('apprenants/<int:pk>/delete/', views.apprenant_delete, name='apprenant_delete'),
     
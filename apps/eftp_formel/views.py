@@ -1,36 +1,81 @@
+import uuid
+from urllib.parse import urlencode
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.db import transaction
 from django.db.models import Sum, Count
-from .models import EtablissementFormel, ApprenantFormel, FormateurFormel, FiliereFormel
-from .forms import EtablissementFormelSimpleForm, EtablissementFormelCompletForm, ApprenantFormelForm, FormateurFormelForm, FiliereFormelForm
+from .models import EtablissementFormel, ApprenantFormel, FormateurFormel, FiliereFormel, SEUIL_COMPLETION
+from .forms import EtablissementFormelSimpleForm, EtablissementFormelCompletForm, ApprenantFormelForm, ApprenantGrilleFormSet, FormateurFormelForm, FiliereFormelForm
+from .statistiques import statistiques_etablissement, statistiques_liste
+from .importers import ImportEtablissements, ImportFormateurs
+from . import exports
+from . import cache as formel_cache
+from apps.core.listes import filtrer, page_par_code
 from apps.renaloc.models import Region
 
 # ================ VUES POUR LES ÉTABLISSEMENTS ================
 
+# Paramètres GET de filtrage de la liste -> champ filtré
+FILTRES_ETABLISSEMENT = {
+    'region': 'region_id',
+    'type': 'type_etablissement',
+    'statut': 'statut',
+    'zone': 'zone',
+}
+
+# Tranches de complétude (mêmes seuils que les barres de progression)
+# Intervalles bornés des deux côtés (le taux est compris entre 0 et 100) : avec une
+# seule borne, SQLite préfère parcourir l'index du code pour éviter le tri de la page
+NIVEAUX_COMPLETUDE = {
+    'complet': {'taux_completion__gte': SEUIL_COMPLETION, 'taux_completion__lte': 100},
+    'partiel': {'taux_completion__gte': 50, 'taux_completion__lt': SEUIL_COMPLETION},
+    'faible': {'taux_completion__gte': 0, 'taux_completion__lt': 50},
+}
+
+
+def filtrer_etablissements(queryset, params):
+    """Applique les filtres de la liste (region, type, statut, zone, completude, q) et renvoie aussi les filtres actifs"""
+    return filtrer(queryset, params, FILTRES_ETABLISSEMENT, tranches={'completude': NIVEAUX_COMPLETUDE})
+
+
 @login_required
 def etablissement_list(request):
-    """Liste des établissements formels"""
-    etablissements = EtablissementFormel.objects.all().select_related('region', 'departement', 'commune')
-    
-    # Calcul des statistiques
-    publics_count = etablissements.filter(statut='PUBLIC').count()
-    prives_count = etablissements.filter(statut='PRIVE').count()
-    
-    # Récupérer tous les apprenants
-    total_apprenants = 0
+    """Liste des établissements formels (filtrée côté serveur, paginée par code)"""
+    try:
+        etablissements, filtres = filtrer_etablissements(EtablissementFormel.objects.all(), request.GET)
+    except ValueError as e:
+        messages.error(request, f"❌ Filtres ignorés : {e}")
+        etablissements, filtres = EtablissementFormel.objects.all(), {}
+    page = page_par_code(
+        etablissements.select_related('region', 'departement', 'commune'),
+        apres=request.GET.get('apres'), avant=request.GET.get('avant'),
+    )
+    
+    # Statistiques du bandeau (une requête, en cache par combinaison de filtres)
+    stats = statistiques_liste(etablissements, filtres)
     
     # Pour les filtres
-    regions = Region.objects.all()
+    regions = Region.objects.only('id', 'nom')
     type_choices = EtablissementFormel.TYPE_ETABLISSEMENT_CHOICES
     
     context = {
-        'etablissements': etablissements,
-        'publics_count': publics_count,
-        'prives_count': prives_count,
-        'total_apprenants': total_apprenants,
+        'etablissements': page['lignes'],
+        'page_apres': page['apres'],
+        'page_avant': page['avant'],
+        'filtres': filtres,
+        'filtres_query': urlencode(filtres),
+        'stats': stats,
+        'total': stats['total'],
+        'publics_count': stats['publics'],
+        'prives_count': stats['prives'],
+        'total_apprenants': stats['apprenants'],
         'regions': regions,
         'type_choices': type_choices,
+        'statut_choices': EtablissementFormel.STATUT_CHOICES,
+        'zone_choices': EtablissementFormel.ZONE_CHOICES,
     }
     return render(request, 'eftp_formel/etablissement_list.html', context)
 
@@ -63,35 +108,20 @@ def etablissement_detail(request, pk):
     """Détail d'un établissement"""
     etablissement = get_object_or_404(EtablissementFormel, pk=pk)
     
-    # Statistiques
-    total_apprenants = ApprenantFormel.objects.filter(etablissement=etablissement).aggregate(
-        total=Sum('masculin') + Sum('feminin')
-    )['total'] or 0
-    
-    apprenants_m = ApprenantFormel.objects.filter(etablissement=etablissement).aggregate(
-        total=Sum('masculin')
-    )['total'] or 0
-    
-    apprenants_f = ApprenantFormel.objects.filter(etablissement=etablissement).aggregate(
-        total=Sum('feminin')
-    )['total'] or 0
-    
-    total_formateurs = FormateurFormel.objects.filter(etablissement=etablissement).count()
-    formateurs_m = FormateurFormel.objects.filter(etablissement=etablissement, sexe='M').count()
-    formateurs_f = FormateurFormel.objects.filter(etablissement=etablissement, sexe='F').count()
-    
-    total_filieres = FiliereFormel.objects.filter(etablissement=etablissement).count()
+    # Statistiques (un agrégat par table liée, en cache)
+    stats = statistiques_etablissement(etablissement.pk)
     filieres = FiliereFormel.objects.filter(etablissement=etablissement)
     
     context = {
         'etablissement': etablissement,
-        'total_apprenants': total_apprenants,
-        'apprenants_m': apprenants_m,
-        'apprenants_f': apprenants_f,
-        'total_formateurs': total_formateurs,
-        'formateurs_m': formateurs_m,
-        'formateurs_f': formateurs_f,
-        'total_filieres': total_filieres,
+        'stats': stats,
+        'total_apprenants': stats['total_apprenants'],
+        'apprenants_m': stats['apprenants_m'],
+        'apprenants_f': stats['apprenants_f'],
+        'total_formateurs': stats['total_formateurs'],
+        'formateurs_m': stats['formateurs_m'],
+        'formateurs_f': stats['formateurs_f'],
+        'total_filieres': stats['total_filieres'],
         'filieres': filieres,
     }
     return render(request, 'eftp_formel/etablissement_detail.html', context)
@@ -142,12 +172,10 @@ def etablissement_complet(request, pk):
     filieres = FiliereFormel.objects.filter(etablissement=etablissement)
     
     # Calculer les totaux
-    total_apprenants = 0
-    for app in apprenants:
-        total_apprenants += (app.masculin or 0) + (app.feminin or 0)
-    
-    total_formateurs = formateurs.count()
-    total_filieres = filieres.count()
+    stats = statistiques_etablissement(etablissement.pk)
+    total_apprenants = stats['total_apprenants']
+    total_formateurs = stats['total_formateurs']
+    total_filieres = stats['total_filieres']
     
     # Calculer la progression globale
     progression = 0
@@ -160,17 +188,17 @@ def etablissement_complet(request, pk):
     if etablissement.code: champs_remplis += 1
     if etablissement.statut: champs_remplis += 1
     if etablissement.zone: champs_remplis += 1
-    if etablissement.region: champs_remplis += 1
-    if etablissement.departement: champs_remplis += 1
-    if etablissement.commune: champs_remplis += 1
+    if etablissement.region_id: champs_remplis += 1
+    if etablissement.departement_id: champs_remplis += 1
+    if etablissement.commune_id: champs_remplis += 1
     if etablissement.type_etablissement: champs_remplis += 1
     if etablissement.regime: champs_remplis += 1
     if etablissement.date_autorisation: champs_remplis += 1
     if etablissement.date_ouverture: champs_remplis += 1
     if etablissement.longitude and etablissement.latitude: champs_remplis += 1
-    if apprenants.exists(): champs_remplis += 1
-    if formateurs.exists(): champs_remplis += 1
-    if filieres.exists(): champs_remplis += 1
+    if stats['lignes_apprenants']: champs_remplis += 1
+    if total_formateurs: champs_remplis += 1
+    if total_filieres: champs_remplis += 1
     
     progression = int((champs_remplis / champs_total) * 100) if champs_total > 0 else 0
     
@@ -179,6 +207,7 @@ def etablissement_complet(request, pk):
         'apprenants': apprenants,
         'formateurs': formateurs,
         'filieres': filieres,
+        'stats': stats,
         'total_apprenants': total_apprenants,
         'total_formateurs': total_formateurs,
         'total_filieres': total_filieres,
@@ -199,10 +228,16 @@ def apprenant_create(request, etablissement_id):
     if request.method == 'POST':
         form = ApprenantFormelForm(request.POST)
         if form.is_valid():
-            apprenant = form.save(commit=False)
-            apprenant.etablissement = etablissement
-            apprenant.save()
-            messages.success(request, "✅ Apprenants ajoutés avec succès!")
+            # Une case déjà saisie reçoit les effectifs en plus
+            donnees = form.cleaned_data
+            cree = ApprenantFormel.objects.cumuler(
+                etablissement, donnees['cycle'], donnees['annee_etude'],
+                **{champ: donnees[champ] for champ in ApprenantFormel.CHAMPS_EFFECTIFS}
+            )
+            if cree:
+                messages.success(request, "✅ Apprenants ajoutés avec succès!")
+            else:
+                messages.success(request, "✅ Effectifs ajoutés à la ligne existante pour ce cycle et cette année")
             return redirect('eftp_formel:etablissement_complet', pk=etablissement.id)
         else:
             messages.error(request, "❌ Veuillez corriger les erreurs")
@@ -257,6 +292,76 @@ def apprenant_delete(request, pk):
     return render(request, 'eftp_formel/apprenant_confirm_delete.html', context)
 
 
+@login_required
+def apprenant_grille(request, etablissement_id):
+    """Saisie en une fois de la grille cycle × année d'étude d'un établissement"""
+    etablissement = get_object_or_404(EtablissementFormel, pk=etablissement_id)
+
+    # Une seule requête : (cycle, année) -> ligne existante
+    existants = {(apprenant.cycle, apprenant.annee_etude): apprenant for apprenant in etablissement.apprenants.all()}
+
+    initial = []
+    for cycle, _ in ApprenantFormel.CYCLE_CHOICES:
+        for annee, _ in ApprenantFormel.ANNEE_ETUDE_CHOICES:
+            apprenant = existants.get((cycle, annee))
+            case = {'cycle': cycle, 'annee_etude': annee}
+            case.update({champ: getattr(apprenant, champ) if apprenant else 0 for champ in ApprenantFormel.CHAMPS_EFFECTIFS})
+            initial.append(case)
+
+    if request.method == 'POST':
+        formset = ApprenantGrilleFormSet(request.POST, initial=initial)
+        if formset.is_valid():
+            a_creer, a_modifier = [], []
+            for form in formset:
+                if not form.has_changed():
+                    continue
+                donnees = form.cleaned_data
+                apprenant = existants.get((donnees['cycle'], donnees['annee_etude']))
+                valeurs = {champ: donnees[champ] for champ in ApprenantFormel.CHAMPS_EFFECTIFS}
+                if apprenant is None:
+                    # Une case vide n'est pas enregistrée
+                    if any(valeurs.values()):
+                        a_creer.append(ApprenantFormel(
+                            etablissement=etablissement, cycle=donnees['cycle'],
+                            annee_etude=donnees['annee_etude'], **valeurs
+                        ))
+                elif any(getattr(apprenant, champ) != valeur for champ, valeur in valeurs.items()):
+                    for champ, valeur in valeurs.items():
+                        setattr(apprenant, champ, valeur)
+                    a_modifier.append(apprenant)
+
+            if a_creer or a_modifier:
+                with transaction.atomic():
+                    ApprenantFormel.objects.bulk_create(a_creer)
+                    ApprenantFormel.objects.bulk_update(a_modifier, ApprenantFormel.CHAMPS_EFFECTIFS)
+                # bulk_create / bulk_update n'émettent pas de signaux
+                formel_cache.invalider('apprenantformel', f'etablissement:{etablissement.pk}')
+                messages.success(request, f"✅ Effectifs enregistrés : {len(a_creer)} case(s) ajoutée(s), {len(a_modifier)} modifiée(s)")
+            else:
+                messages.info(request, "ℹ️ Aucune modification à enregistrer")
+            return redirect('eftp_formel:etablissement_complet', pk=etablissement.id)
+        else:
+            messages.error(request, "❌ Veuillez corriger les erreurs")
+    else:
+        formset = ApprenantGrilleFormSet(initial=initial)
+
+    # Lignes du tableau : un cycle, ses formulaires par année
+    nb_annees = len(ApprenantFormel.ANNEE_ETUDE_CHOICES)
+    grille = [
+        (libelle, formset.forms[i * nb_annees:(i + 1) * nb_annees])
+        for i, (_, libelle) in enumerate(ApprenantFormel.CYCLE_CHOICES)
+    ]
+
+    context = {
+        'formset': formset,
+        'grille': grille,
+        'annees': ApprenantFormel.ANNEE_ETUDE_CHOICES,
+        'etablissement': etablissement,
+        'titre': f"Grille des effectifs - {etablissement.nom}"
+    }
+    return render(request, 'eftp_formel/apprenant_grille.html', context)
+
+
 # ================ VUES POUR LES FORMATEURS ================
 
 @login_required
@@ -391,6 +496,18 @@ def filiere_delete(request, pk):
 
 # ================ VUES POUR IMPORT/EXPORT ================
 
+# Importeurs disponibles (valeur du champ « Type de données » du formulaire)
+IMPORTEURS = {
+    'etablissement': ImportEtablissements,
+    'formateur': ImportFormateurs,
+}
+LIGNES_RAPPORT = 500
+
+
+def _cle_rejets(request, jeton):
+    # Le fichier de rejets n'est accessible qu'à l'utilisateur qui a lancé l'import
+    return f'eftp_formel:rejets:{request.user.pk}:{jeton}'
+
 @login_required
 def import_export(request):
     """Page d'import/export"""
@@ -400,16 +517,55 @@ def import_export(request):
 def import_data(request):
     """Importation des données depuis un fichier"""
     if request.method == 'POST' and request.FILES.get('file'):
-        # Logique d'import à implémenter
-        messages.success(request, "Import réussi (simulation)")
-        return redirect('eftp_formel:import_export')
+        importeur = IMPORTEURS.get(request.POST.get('model'))
+        if importeur is None:
+            messages.warning(request, "L'import de ce type de données n'est pas encore disponible")
+            return redirect('eftp_formel:import_export')
+        
+        importeur = importeur()
+        try:
+            rapport = importeur.executer(request.FILES['file'])
+        except ValueError as e:
+            messages.error(request, f"❌ {e}")
+            return redirect('eftp_formel:import_export')
+        
+        stats = importeur.stats
+        messages.success(
+            request,
+            f"Import terminé : {stats['crees']} créé(s), {stats['modifies']} modifié(s), "
+            f"{stats['inchanges']} inchangé(s), {stats['rejetes']} ligne(s) rejetée(s)"
+        )
+        context = {
+            'rapport': rapport[:LIGNES_RAPPORT],
+            'rapport_tronque': len(rapport) > LIGNES_RAPPORT,
+            'stats': stats,
+        }
+        rejets = importeur.fichier_rejets()
+        if rejets:
+            jeton = uuid.uuid4().hex
+            cache.set(_cle_rejets(request, jeton), rejets, formel_cache.TIMEOUT)
+            context['jeton_rejets'] = jeton
+        return render(request, 'eftp_formel/import_export.html', context)
     
     messages.error(request, "Aucun fichier sélectionné")
     return redirect('eftp_formel:import_export')
 
+@login_required
+def import_rejets(request, jeton):
+    """Téléchargement des lignes rejetées du dernier import (CSV à corriger puis réimporter)"""
+    contenu = cache.get(_cle_rejets(request, jeton))
+    if contenu is None:
+        raise Http404("Fichier de rejets expiré ou introuvable")
+    response = HttpResponse(contenu, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="lignes_rejetees.csv"'
+    return response
+
 @login_required
 def export_data(request):
-    """Exportation des données"""
-    # Logique d'export à implémenter
-    from django.http import HttpResponse
-    return HttpResponse("Export en cours de développement")
\ No newline at end of file
+    """Exportation des données (CSV, CSV zippé ou XLSX multi-feuilles, en flux)"""
+    modele = request.GET.get('model', 'all')
+    format_export = request.GET.get('format', 'excel')
+    if (modele != 'all' and modele not in exports.FEUILLES) or format_export not in ('excel', 'csv'):
+        messages.error(request, "Type de données ou format d'export invalide")
+        return redirect('eftp_formel:import_export')
+    return exports.export_registre(modele, format_export)
\ No newline at end of file
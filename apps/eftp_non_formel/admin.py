@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from .models import (
     StructureNonFormelle, ApprentiNonFormel, 
     MaitreArtisan, MetierNonFormel
@@ -21,8 +23,9 @@ class MetierInline(admin.TabularInline):
 
 @admin.register(StructureNonFormelle)
 class StructureNonFormelleAdmin(admin.ModelAdmin):
-    list_display = ('code', 'nom', 'statut', 'zone', 'region', 'type_structure', 'nb_apprentis')
+    list_display = ('code', 'nom', 'statut', 'zone', 'region', 'type_structure', 'nb_apprentis', 'taux_completion')
     list_filter = ('statut', 'zone', 'type_structure', 'a_electricite', 'a_point_eau', 'a_connexion_internet')
+    list_select_related = ('region',)
     search_fields = ('code', 'nom', 'region__nom', 'departement__nom')
     readonly_fields = ('created_at', 'updated_at')
     date_hierarchy = 'date_ouverture'
@@ -79,10 +82,16 @@ class StructureNonFormelleAdmin(admin.ModelAdmin):
     
     inlines = [ApprentiInline, MaitreArtisanInline, MetierInline]
     
+    def get_queryset(self, request):
+        # Total calculé par la base (une seule relation jointe) : triable, sans requête par ligne
+        return super().get_queryset(request).annotate(
+            total_apprentis=Coalesce(Sum(F('apprentis__masculin') + F('apprentis__feminin')), 0)
+        )
+    
     def nb_apprentis(self, obj):
-        total = sum(app.masculin + app.feminin for app in obj.apprentis.all())
-        return total
+        return obj.total_apprentis
     nb_apprentis.short_description = "Total apprentis"
+    nb_apprentis.admin_order_field = 'total_apprentis'
 
 @admin.register(ApprentiNonFormel)
 class ApprentiNonFormelAdmin(admin.ModelAdmin):
@@ -90,9 +99,13 @@ class ApprentiNonFormelAdmin(admin.ModelAdmin):
     list_filter = ('secteur', 'duree_apprentissage', 'structure__region')
     search_fields = ('structure__nom', 'structure__code')
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(total_effectif=F('masculin') + F('feminin'))
+    
     def total(self, obj):
-        return obj.masculin + obj.feminin
+        return obj.total_effectif
     total.short_description = "Total"
+    total.admin_order_field = 'total_effectif'
 
 @admin.register(MaitreArtisan)
 class MaitreArtisanAdmin(admin.ModelAdmin):
@@ -144,8 +157,14 @@ class MetierNonFormelAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(total_effectif=(
+            F('promo_1_m') + F('promo_1_f') +
+            F('promo_2_m') + F('promo_2_f') +
+            F('promo_3_m') + F('promo_3_f')
+        ))
+    
     def effectif_total(self, obj):
-        return (obj.promo_1_m + obj.promo_1_f + 
-                obj.promo_2_m + obj.promo_2_f + 
-                obj.promo_3_m + obj.promo_3_f)
-    effectif_total.short_description = "Effectif total"
\ No newline at end of file
+        return obj.total_effectif
+    effectif_total.short_description = "Effectif total"
+    effectif_total.admin_order_field = 'total_effectif'
\ No newline at end of file
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:04
+
+from django.db import migrations, models
+from apps.core.completion import expression_completion
+
+# CHAMPS_COMPLETION du modèle à la date de la migration (le modèle historique ne le porte pas)
+CHAMPS_COMPLETION = [
+    'nom', 'code', 'statut', 'zone', 'region', 'departement', 'commune',
+    'type_structure', 'regime', 'date_autorisation', 'date_ouverture',
+    'longitude', 'latitude', 'a_electricite', 'a_point_eau', 'a_latrines',
+]
+
+
+def calculer_taux(apps, schema_editor):
+    """Même UPDATE que la commande recalculer_completion, sur le modèle historique"""
+    model = apps.get_model('eftp_non_formel', 'StructureNonFormelle')
+    expression = expression_completion(model, CHAMPS_COMPLETION)
+    model.objects.exclude(taux_completion=expression).update(taux_completion=expression)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eftp_non_formel', '0002_alter_apprentinonformel_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='structurenonformelle',
+            name='taux_completion',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False, verbose_name='Complétude (%)'),
+        ),
+        migrations.RunPython(calculer_taux, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from apps.renaloc.models import Region, Departement, Commune, QuartierVillage
+from apps.core.completion import CompletionQuerySet
 
 class StructureNonFormelle(models.Model):
     """Modèle pour les structures d'EFTP non formel"""
@@ -167,9 +168,15 @@ class StructureNonFormelle(models.Model):
     nb_formateurs_f = models.IntegerField(default=0, verbose_name="Formateurs F")
     
     # Métadonnées
+    # Complétude enregistrée (recalculée à chaque save) pour filtrer et trier en SQL
+    taux_completion = models.PositiveSmallIntegerField(default=0, editable=False, db_index=True,
+                                                      verbose_name="Complétude (%)")
+    
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True, verbose_name="Date de modification")    
     
+    objects = CompletionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['code']
         verbose_name = "Structure non formelle"
@@ -180,22 +187,32 @@ class StructureNonFormelle(models.Model):
             return f"{self.sigle} - {self.nom}"
         return self.nom
     
+    # Champs pris en compte par le taux de complétude
+    CHAMPS_COMPLETION = [
+        'nom', 'code', 'statut', 'zone', 'region', 'departement', 'commune',
+        'type_structure', 'regime', 'date_autorisation', 'date_ouverture',
+        'longitude', 'latitude', 'a_electricite', 'a_point_eau', 'a_latrines'
+    ]
+    
     def get_completion_percentage(self):
-        """Calcule le pourcentage de complétude de la structure"""
-        champs_importants = [
-            'nom', 'code', 'statut', 'zone', 'region', 'departement', 'commune',
-            'type_structure', 'regime', 'date_autorisation', 'date_ouverture',
-            'longitude', 'latitude', 'a_electricite', 'a_point_eau', 'a_latrines'
-        ]
-        
+        """
+        Calcule le pourcentage de complétude de la structure
+        (même règle en SQL : StructureNonFormelle.objects.avec_completion())
+        """
         filled = 0
-        for champ in champs_importants:
-            value = getattr(self, champ)
+        for champ in self.CHAMPS_COMPLETION:
+            value = getattr(self, self._meta.get_field(champ).attname)
             if value not in [None, '', False, []]:
                 filled += 1
         
-        total = len(champs_importants)
+        total = len(self.CHAMPS_COMPLETION)
         return int((filled / total) * 100) if total > 0 else 0
+    
+    def save(self, *args, **kwargs):
+        self.taux_completion = self.get_completion_percentage()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'taux_completion'}
+        super().save(*args, **kwargs)
 
 
 class MaitreArtisan(models.Model):
@@ -6,6 +6,7 @@ app_name = 'eftp_non_formel'
 urlpatterns = [
     # Structures
     path('structures/', views.structure_list, name='structure_list'),
+    path('structures/api/', views.structure_api, name='structure_api'),
     path('structures/create/', views.structure_create, name='structure_create'),
     path('structures/<int:pk>/', views.structure_detail, name='structure_detail'),
     path('structures/<int:pk>/edit/', views.structure_edit, name='structure_edit'),
@@ -2,40 +2,120 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.contrib import messages
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 from django.http import JsonResponse
 from .models import StructureNonFormelle, MaitreArtisan, ApprentiNonFormel, MetierNonFormel
 from .forms import (
     StructureNonFormelleSimpleForm, StructureNonFormelleCompletForm,
     MaitreArtisanForm, ApprentiNonFormelForm, MetierNonFormelForm
 )
+from apps.core.listes import TAILLE_PAGE, filtrer, page_par_code
 from apps.renaloc.models import Region
 
 # ================ VUES POUR LES STRUCTURES ================
 
+TAILLE_PAGE_MAX = 200
+
+# Paramètres GET de filtrage -> champ filtré
+FILTRES_STRUCTURE = {
+    'type': 'type_structure',
+    'region': 'region_id',
+    'statut': 'statut',
+    'zone': 'zone',
+}
+
+# Équipements filtrables (paramètre = nom du champ, valeur 1 / 0)
+INFRASTRUCTURES = [
+    'a_electricite', 'a_point_eau', 'a_cloture', 'a_infirmerie', 'a_boite_pharmacie',
+    'a_depotoir', 'a_rampes_handicapes', 'a_cour_recreation', 'a_latrines', 'a_bibliotheque',
+    'a_connexion_internet', 'a_terrain_sport', 'a_paysage', 'a_parking', 'a_lavage_mains',
+    'a_collecte_ordures',
+]
+
+# Champs disponibles dans l'API (paramètre fields) -> chemin lu par values()
+CHAMPS_API = {
+    'id': 'id', 'code': 'code', 'sigle': 'sigle', 'nom': 'nom',
+    'type_structure': 'type_structure', 'statut': 'statut', 'zone': 'zone',
+    'region_id': 'region_id', 'region': 'region__nom',
+    'departement': 'departement__nom', 'commune': 'commune__nom',
+    'taux_completion': 'taux_completion',
+    **{champ: champ for champ in INFRASTRUCTURES},
+}
+CHAMPS_API_DEFAUT = ['id', 'code', 'sigle', 'nom', 'type_structure', 'statut', 'region', 'zone', 'taux_completion']
+
+
+def filtrer_structures(queryset, params):
+    """Applique les filtres de la liste (type, region, statut, zone, équipements, q) ; ValueError si invalide"""
+    queryset, _ = filtrer(queryset, params, FILTRES_STRUCTURE, booleens=INFRASTRUCTURES)
+    return queryset
+
+
 @login_required
 def structure_list(request):
-    """Liste des structures non formelles"""
-    structures = StructureNonFormelle.objects.all().select_related('region', 'departement', 'commune')
-    
-    # Calcul des statistiques
-    publiques_count = structures.filter(statut='PUBLIC').count()
-    privees_count = structures.filter(statut='PRIVE').count()
-    
-    # Pour les filtres
-    regions = Region.objects.all()
-    type_choices = StructureNonFormelle.TYPE_STRUCTURE_CHOICES
+    """Liste des structures non formelles (les lignes sont chargées page par page via structure_api)"""
+    # Statistiques en une requête
+    stats = StructureNonFormelle.objects.aggregate(
+        total=Count('id'),
+        publiques=Count('id', filter=Q(statut='PUBLIC')),
+        privees=Count('id', filter=Q(statut='PRIVE')),
+    )
+    total_apprentis = ApprentiNonFormel.objects.aggregate(
+        total=Sum('masculin') + Sum('feminin')
+    )['total'] or 0
     
     context = {
-        'structures': structures,
-        'publiques_count': publiques_count,
-        'privees_count': privees_count,
-        'regions': regions,
-        'type_choices': type_choices,
+        'total': stats['total'],
+        'publiques_count': stats['publiques'],
+        'privees_count': stats['privees'],
+        'total_apprentis': total_apprentis,
+        'regions': Region.objects.all(),
+        'type_choices': StructureNonFormelle.TYPE_STRUCTURE_CHOICES,
+        'infrastructures': [
+            (champ, StructureNonFormelle._meta.get_field(champ).verbose_name) for champ in INFRASTRUCTURES
+        ],
+        'taille_page': TAILLE_PAGE,
     }
     return render(request, 'eftp_non_formel/structure_list.html', context)
 
 
+@login_required
+def structure_api(request):
+    """
+    Page JSON de structures : filtres, champs choisis (fields=code,nom,...) et
+    pagination par curseur sur le code (apres / avant), sans OFFSET
+    """
+    try:
+        queryset = filtrer_structures(StructureNonFormelle.objects.all(), request.GET)
+    except ValueError as e:
+        return JsonResponse({'erreur': str(e)}, status=400)
+    try:
+        taille = min(max(int(request.GET.get('limit', TAILLE_PAGE)), 1), TAILLE_PAGE_MAX)
+    except ValueError:
+        return JsonResponse({'erreur': "Paramètre limit invalide"}, status=400)
+
+    champs = [champ.strip() for champ in request.GET.get('fields', '').split(',') if champ.strip()] or CHAMPS_API_DEFAUT
+    inconnus = [champ for champ in champs if champ not in CHAMPS_API]
+    if inconnus:
+        return JsonResponse({'erreur': f"Champ(s) inconnu(s) : {', '.join(inconnus)}"}, status=400)
+
+    # Le code sert de curseur : toujours lu, renvoyé seulement s'il est demandé
+    queryset = queryset.values(*{CHAMPS_API[champ] for champ in champs} | {'code'})
+
+    apres = request.GET.get('apres', '').strip()
+    avant = request.GET.get('avant', '').strip()
+    page = page_par_code(queryset, apres=apres, avant=avant, taille=taille)
+
+    data = {
+        'resultats': [{champ: ligne[CHAMPS_API[champ]] for champ in champs} for ligne in page['lignes']],
+        'apres': page['apres'],
+        'avant': page['avant'],
+    }
+    # Nombre total uniquement pour la première page
+    if not apres and not avant:
+        data['total'] = queryset.count()
+    return JsonResponse(data)
+
+
 @login_required
 def structure_create(request):
     """Créer une nouvelle structure (formulaire simplifié)"""
@@ -3,11 +3,57 @@ Configuration de l'interface d'administration pour le module Renaloc
 Gestion des localités du Niger : Régions, Départements, Communes, Quartiers/Villages
 """
 
+import itertools
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from django.db.models import Count
-from .models import Region, Departement, Commune, QuartierVillage
+from django.db.models import Count, Prefetch, Q
+from .models import Region, Departement, Commune, QuartierVillage, JournalModification
+from . import cache as renaloc_cache
+from . import evenements
+from . import exports
+from apps.core.exports import lignes_queryset, reponse_csv
+
+# Nombre d'éléments affichés dans les colonnes d'aperçu
+APERCU = 3
+
+class LocaliteListFilter(admin.RelatedFieldListFilter):
+    """
+    Filtre par localité parente : libellés chargés en une requête (avec les parents
+    affichés par __str__) ; sur un modèle Renaloc, la sélection porte sur le chemin
+    indexé (LocaliteQuerySet.dans) au lieu d'une jointure
+    """
+    relations = ()
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin) or ('nom',)
+        localites = field.related_model.objects.select_related(*self.relations).order_by(*ordering)
+        return [(localite.pk, str(localite)) for localite in localites]
+
+    def queryset(self, request, queryset):
+        valeur = self.used_parameters.get(self.lookup_kwarg)
+        if not valeur or not hasattr(queryset, 'dans'):
+            return super().queryset(request, queryset)
+        try:
+            localite = self.field.related_model.objects.only('chemin').get(pk=valeur)
+        except (ValueError, ValidationError, ObjectDoesNotExist) as e:
+            raise IncorrectLookupParameters(e)
+        return queryset.dans(localite)
+
+class RegionListFilter(LocaliteListFilter):
+    """Filtre par région"""
+
+class DepartementListFilter(LocaliteListFilter):
+    """Filtre par département : libellés « Département (Région) »"""
+    relations = ('region',)
+
+class CommuneListFilter(LocaliteListFilter):
+    """Filtre par commune : libellés « Commune (Département) »"""
+    relations = ('departement',)
 
 class DepartementInline(admin.TabularInline):
     """
@@ -21,8 +67,11 @@ class DepartementInline(admin.TabularInline):
     can_delete = True
     classes = ['collapse']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(communes_count=Count('communes'))
+    
     def nb_communes_display(self, obj):
-        return obj.communes.count()
+        return obj.communes_count
     nb_communes_display.short_description = "Nombre de communes"
     
     def lien_vers_communes(self, obj):
@@ -44,8 +93,11 @@ class CommuneInline(admin.TabularInline):
     can_delete = True
     classes = ['collapse']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(quartiers_count=Count('quartiers'))
+    
     def nb_quartiers_display(self, obj):
-        return obj.quartiers.count()
+        return obj.quartiers_count
     nb_quartiers_display.short_description = "Nombre de quartiers"
     
     def lien_vers_quartiers(self, obj):
@@ -102,12 +154,18 @@ class RegionAdmin(admin.ModelAdmin):
     actions = ['exporter_selection', 'dupliquer_region']
     
     def get_queryset(self, request):
-        """Optimisation des requêtes"""
-        return super().get_queryset(request).prefetch_related('departements__communes')
+        """Compteurs annotés et aperçu préchargé : nombre de requêtes constant par page"""
+        return super().get_queryset(request).annotate(
+            departements_count=Count('departements', distinct=True),
+            communes_count=Count('departements__communes', distinct=True),
+        ).prefetch_related(
+            Prefetch('departements', queryset=Departement.objects.order_by('nom')[:APERCU],
+                     to_attr='apercu_departements_list')
+        )
     
     def nb_departements(self, obj):
         """Nombre de départements dans la région"""
-        count = obj.departements.count()
+        count = obj.departements_count
         url = reverse('admin:renaloc_departement_changelist') + f'?region__id__exact={obj.id}'
         return format_html('<a href="{}">{} département(s)</a>', url, count)
     nb_departements.short_description = "Départements"
@@ -115,25 +173,26 @@ class RegionAdmin(admin.ModelAdmin):
     
     def nb_communes(self, obj):
         """Nombre total de communes dans la région"""
-        count = Commune.objects.filter(departement__region=obj).count()
+        count = obj.communes_count
         url = reverse('admin:renaloc_commune_changelist') + f'?departement__region__id__exact={obj.id}'
         return format_html('<a href="{}">{} commune(s)</a>', url, count)
     nb_communes.short_description = "Communes"
+    nb_communes.admin_order_field = 'communes_count'
     
     def nb_departements_display(self, obj):
         """Affichage pour les champs readonly"""
-        return obj.departements.count()
+        return getattr(obj, 'departements_count', 0)
     nb_departements_display.short_description = "Nombre de départements"
     
     def nb_communes_display(self, obj):
         """Affichage pour les champs readonly"""
-        return Commune.objects.filter(departement__region=obj).count()
+        return getattr(obj, 'communes_count', 0)
     nb_communes_display.short_description = "Nombre de communes"
     
     def apercu_departements(self, obj):
         """Aperçu des premiers départements"""
-        deps = obj.departements.all()[:3]
-        return ", ".join([d.nom for d in deps]) + ("..." if obj.departements.count() > 3 else "")
+        deps = obj.apercu_departements_list
+        return ", ".join([d.nom for d in deps]) + ("..." if obj.departements_count > APERCU else "")
     apercu_departements.short_description = "Départements (aperçu)"
     
     def date_creation(self, obj):
@@ -144,24 +203,18 @@ class RegionAdmin(admin.ModelAdmin):
     
     def exporter_selection(self, request, queryset):
         """Action pour exporter les régions sélectionnées"""
-        from django.http import HttpResponse
-        import csv
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="regions_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Code', 'Nom', 'Nombre départements', 'Date création'])
-        
-        for region in queryset:
-            writer.writerow([
-                region.code,
-                region.nom,
-                region.departements.count(),
-                region.created_at.strftime("%d/%m/%Y") if region.created_at else ""
-            ])
-        
+        queryset = exports.annoter_pour_export(queryset, 'departements_count')
+        lignes = lignes_queryset(queryset, [
+            ('Code', 'code'), ('Nom', 'nom'),
+            ('Nombre départements', 'departements_count'), ('Date création', 'created_at'),
+        ])
+        en_tete = next(lignes)
+        lignes = (
+            (code, nom, nombre, created_at.strftime("%d/%m/%Y") if created_at else "")
+            for code, nom, nombre, created_at in lignes
+        )
         self.message_user(request, f"{queryset.count()} région(s) exportée(s)")
-        return response
+        return reponse_csv(itertools.chain([en_tete], lignes), 'regions_export.csv')
     exporter_selection.short_description = "Exporter les régions sélectionnées (CSV)"
     
     def dupliquer_region(self, request, queryset):
@@ -186,7 +239,7 @@ class DepartementAdmin(admin.ModelAdmin):
     Administration des départements du Niger
     """
     list_display = ('code', 'nom', 'region', 'nb_communes', 'apercu_communes', 'type_zone')
-    list_filter = ('region', 'communes__type_commune')
+    list_filter = (('region', RegionListFilter), 'communes__type_commune')
     search_fields = ('code', 'nom', 'region__nom')
     search_help_text = "Rechercher par code, nom ou région"
     ordering = ('region__code', 'code')
@@ -215,12 +268,18 @@ class DepartementAdmin(admin.ModelAdmin):
     actions = ['exporter_selection', 'changer_region']
     
     def get_queryset(self, request):
-        """Optimisation des requêtes"""
-        return super().get_queryset(request).prefetch_related('communes')
+        """Compteurs annotés (dont la part de communes urbaines) et aperçu préchargé"""
+        return super().get_queryset(request).annotate(
+            communes_count=Count('communes', distinct=True),
+            urbaines_count=Count('communes', filter=Q(communes__type_commune='URBAINE'), distinct=True),
+        ).prefetch_related(
+            Prefetch('communes', queryset=Commune.objects.order_by('nom')[:APERCU],
+                     to_attr='apercu_communes_list')
+        )
     
     def nb_communes(self, obj):
         """Nombre de communes dans le département"""
-        count = obj.communes.count()
+        count = obj.communes_count
         url = reverse('admin:renaloc_commune_changelist') + f'?departement__id__exact={obj.id}'
         return format_html('<a href="{}">{} commune(s)</a>', url, count)
     nb_communes.short_description = "Communes"
@@ -228,13 +287,13 @@ class DepartementAdmin(admin.ModelAdmin):
     
     def nb_communes_display(self, obj):
         """Affichage pour les champs readonly"""
-        return obj.communes.count()
+        return getattr(obj, 'communes_count', 0)
     nb_communes_display.short_description = "Nombre de communes"
     
     def apercu_communes(self, obj):
         """Aperçu des premières communes"""
-        comms = obj.communes.all()[:3]
-        return ", ".join([c.nom for c in comms]) + ("..." if obj.communes.count() > 3 else "")
+        comms = obj.apercu_communes_list
+        return ", ".join([c.nom for c in comms]) + ("..." if obj.communes_count > APERCU else "")
     apercu_communes.short_description = "Communes (aperçu)"
     
     def apercu_communes_display(self, obj):
@@ -247,10 +306,8 @@ class DepartementAdmin(admin.ModelAdmin):
     
     def type_zone(self, obj):
         """Détermine si le département est plutôt urbain ou rural"""
-        communes = obj.communes.all()
-        if communes:
-            urbaines = communes.filter(type_commune='URBAINE').count()
-            if urbaines > communes.count() / 2:
+        if obj.communes_count:
+            if obj.urbaines_count > obj.communes_count / 2:
                 return format_html('<span style="color: #28a745;">🏙️ Urbain</span>')
             else:
                 return format_html('<span style="color: #6c757d;">🌾 Rural</span>')
@@ -275,7 +332,12 @@ class DepartementAdmin(admin.ModelAdmin):
             region_id = request.POST.get('region')
             if region_id:
                 region = Region.objects.get(id=region_id)
-                count = queryset.update(region=region)
+                # save() recalcule le chemin du département et de ses communes/quartiers
+                count = 0
+                for dept in queryset:
+                    dept.region = region
+                    dept.save()
+                    count += 1
                 self.message_user(request, f"{count} département(s) déplacé(s) vers {region.nom}")
             return None
         
@@ -294,24 +356,12 @@ class DepartementAdmin(admin.ModelAdmin):
     
     def exporter_selection(self, request, queryset):
         """Action pour exporter les départements sélectionnés"""
-        from django.http import HttpResponse
-        import csv
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="departements_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Code', 'Nom', 'Région', 'Nombre communes'])
-        
-        for dept in queryset:
-            writer.writerow([
-                dept.code,
-                dept.nom,
-                dept.region.nom,
-                dept.communes.count()
-            ])
-        
+        queryset = exports.annoter_pour_export(queryset, 'communes_count')
+        lignes = lignes_queryset(queryset, [
+            ('Code', 'code'), ('Nom', 'nom'), ('Région', 'region__nom'), ('Nombre communes', 'communes_count'),
+        ])
         self.message_user(request, f"{queryset.count()} département(s) exporté(s)")
-        return response
+        return reponse_csv(lignes, 'departements_export.csv')
     exporter_selection.short_description = "Exporter les départements sélectionnés (CSV)"
 
 @admin.register(Commune)
@@ -320,7 +370,7 @@ class CommuneAdmin(admin.ModelAdmin):
     Administration des communes du Niger
     """
     list_display = ('code', 'nom', 'departement', 'region', 'type_commune_badge', 'nb_quartiers', 'apercu_quartiers')
-    list_filter = ('type_commune', 'departement__region', 'departement')
+    list_filter = ('type_commune', ('departement__region', RegionListFilter), ('departement', DepartementListFilter))
     search_fields = ('code', 'nom', 'departement__nom', 'departement__region__nom')
     search_help_text = "Rechercher par code, nom, département ou région"
     ordering = ('departement__code', 'code')
@@ -348,8 +398,13 @@ class CommuneAdmin(admin.ModelAdmin):
     actions = ['exporter_selection', 'marquer_urbain', 'marquer_rural']
     
     def get_queryset(self, request):
-        """Optimisation des requêtes"""
-        return super().get_queryset(request).prefetch_related('quartiers')
+        """Compteur annoté et aperçu préchargé : nombre de requêtes constant par page"""
+        return super().get_queryset(request).annotate(
+            quartiers_count=Count('quartiers', distinct=True),
+        ).prefetch_related(
+            Prefetch('quartiers', queryset=QuartierVillage.objects.order_by('nom')[:APERCU],
+                     to_attr='apercu_quartiers_list')
+        )
     
     def region(self, obj):
         """Région de la commune"""
@@ -372,7 +427,7 @@ class CommuneAdmin(admin.ModelAdmin):
     
     def nb_quartiers(self, obj):
         """Nombre de quartiers dans la commune"""
-        count = obj.quartiers.count()
+        count = obj.quartiers_count
         url = reverse('admin:renaloc_quartiervillage_changelist') + f'?commune__id__exact={obj.id}'
         return format_html('<a href="{}">{} quartier(s)</a>', url, count)
     nb_quartiers.short_description = "Quartiers"
@@ -380,13 +435,13 @@ class CommuneAdmin(admin.ModelAdmin):
     
     def nb_quartiers_display(self, obj):
         """Affichage pour les champs readonly"""
-        return obj.quartiers.count()
+        return getattr(obj, 'quartiers_count', 0)
     nb_quartiers_display.short_description = "Nombre de quartiers"
     
     def apercu_quartiers(self, obj):
         """Aperçu des premiers quartiers"""
-        quarts = obj.quartiers.all()[:3]
-        return ", ".join([q.nom for q in quarts]) + ("..." if obj.quartiers.count() > 3 else "")
+        quarts = obj.apercu_quartiers_list
+        return ", ".join([q.nom for q in quarts]) + ("..." if obj.quartiers_count > APERCU else "")
     apercu_quartiers.short_description = "Quartiers (aperçu)"
     
     def population_estimate(self, obj):
@@ -406,40 +461,46 @@ class CommuneAdmin(admin.ModelAdmin):
         )
     coordonnees.short_description = "Coordonnées GPS"
     
+    def changer_type(self, queryset, type_commune):
+        """
+        Change le type des communes en un UPDATE ; update() n'émet pas post_save :
+        journal et cache sont mis à jour ici, après la validation de la transaction
+        """
+        with transaction.atomic():
+            communes = list(
+                Commune.objects.filter(pk__in=queryset.values('pk'))
+                .exclude(type_commune=type_commune).only('pk', 'code', 'nom')
+            )
+            count = Commune.objects.filter(pk__in=[commune.pk for commune in communes]).update(
+                type_commune=type_commune, updated_at=timezone.now()
+            )
+            for commune in communes:
+                evenements.enregistrer('MODIFICATION', commune, details={'type_commune': type_commune})
+            if count:
+                transaction.on_commit(lambda: renaloc_cache.invalider('commune'))
+        return count
+    
     def marquer_urbain(self, request, queryset):
         """Action pour marquer les communes comme urbaines"""
-        count = queryset.update(type_commune='URBAINE')
+        count = self.changer_type(queryset, 'URBAINE')
         self.message_user(request, f"{count} commune(s) marquée(s) comme urbaine(s)")
     marquer_urbain.short_description = "Marquer comme urbaine"
     
     def marquer_rural(self, request, queryset):
         """Action pour marquer les communes comme rurales"""
-        count = queryset.update(type_commune='RURALE')
+        count = self.changer_type(queryset, 'RURALE')
         self.message_user(request, f"{count} commune(s) marquée(s) comme rurale(s)")
     marquer_rural.short_description = "Marquer comme rurale"
     
     def exporter_selection(self, request, queryset):
         """Action pour exporter les communes sélectionnées"""
-        from django.http import HttpResponse
-        import csv
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="communes_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Code', 'Nom', 'Département', 'Région', 'Type', 'Nombre quartiers'])
-        
-        for commune in queryset:
-            writer.writerow([
-                commune.code,
-                commune.nom,
-                commune.departement.nom,
-                commune.departement.region.nom,
-                commune.type_commune,
-                commune.quartiers.count()
-            ])
-        
+        queryset = exports.annoter_pour_export(queryset, 'quartiers_count')
+        lignes = lignes_queryset(queryset, [
+            ('Code', 'code'), ('Nom', 'nom'), ('Département', 'departement__nom'),
+            ('Région', 'departement__region__nom'), ('Type', 'type_commune'), ('Nombre quartiers', 'quartiers_count'),
+        ])
         self.message_user(request, f"{queryset.count()} commune(s) exportée(s)")
-        return response
+        return reponse_csv(lignes, 'communes_export.csv')
     exporter_selection.short_description = "Exporter les communes sélectionnées (CSV)"
 
 @admin.register(QuartierVillage)
@@ -448,7 +509,8 @@ class QuartierVillageAdmin(admin.ModelAdmin):
     Administration des quartiers et villages du Niger
     """
     list_display = ('code', 'nom', 'commune', 'departement', 'region', 'type_quartier_icon')
-    list_filter = ('commune__departement__region', 'commune__departement', 'commune')
+    list_filter = (('commune__departement__region', RegionListFilter), ('commune__departement', DepartementListFilter),
+                   ('commune', CommuneListFilter))
     search_fields = ('code', 'nom', 'commune__nom', 'commune__departement__nom')
     search_help_text = "Rechercher par code, nom, commune ou département"
     ordering = ('commune__code', 'code')
@@ -513,23 +575,30 @@ class QuartierVillageAdmin(admin.ModelAdmin):
     
     def exporter_selection(self, request, queryset):
         """Action pour exporter les quartiers sélectionnés"""
-        from django.http import HttpResponse
-        import csv
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="quartiers_export.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow(['Code', 'Nom', 'Commune', 'Département', 'Région'])
-        
-        for quartier in queryset:
-            writer.writerow([
-                quartier.code,
-                quartier.nom,
-                quartier.commune.nom,
-                quartier.commune.departement.nom,
-                quartier.commune.departement.region.nom
-            ])
-        
+        lignes = lignes_queryset(queryset, [
+            ('Code', 'code'), ('Nom', 'nom'), ('Commune', 'commune__nom'),
+            ('Département', 'commune__departement__nom'), ('Région', 'commune__departement__region__nom'),
+        ])
         self.message_user(request, f"{queryset.count()} quartier(s) exporté(s)")
-        return response
-    exporter_selection.short_description = "Exporter les quartiers sélectionnés (CSV)"
\ No newline at end of file
+        return reponse_csv(lignes, 'quartiers_export.csv')
+    exporter_selection.short_description = "Exporter les quartiers sélectionnés (CSV)"
+
+@admin.register(JournalModification)
+class JournalModificationAdmin(admin.ModelAdmin):
+    """
+    Consultation du journal des modifications (lecture seule)
+    """
+    list_display = ('date', 'action', 'modele', 'code', 'nom', 'nombre')
+    list_filter = ('action', 'modele')
+    search_fields = ('code', 'nom')
+    date_hierarchy = 'date'
+    list_per_page = 50
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,28 @@
+"""
+Cache des vues Renaloc (listes en cascade, statistiques, hiérarchie)
+Générations de apps/core/cache.py dans l'espace 'renaloc' : les signaux
+post_save / post_delete changent la génération d'un modèle, ce qui invalide
+toutes les entrées qui en dépendent.
+"""
+
+from apps.core import cache as core_cache
+
+ESPACE = 'renaloc'
+
+# Noms des modèles Renaloc (Model._meta.model_name)
+MODELES = ('region', 'departement', 'commune', 'quartiervillage')
+
+TIMEOUT = 60 * 60 * 24
+
+
+def generation(modele):
+    return core_cache.generation(ESPACE, modele)
+
+
+def invalider(*modeles):
+    """Invalide toutes les entrées dépendant des modèles donnés (tous par défaut)"""
+    core_cache.invalider(ESPACE, modeles or MODELES)
+
+
+def get_or_set(cle, modeles, calcul, timeout=TIMEOUT):
+    return core_cache.get_or_set(ESPACE, cle, modeles, calcul, timeout)
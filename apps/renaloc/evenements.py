@@ -0,0 +1,111 @@
+"""
+Flux d'événements de modification des localités Renaloc
+Les événements sont mis en tampon en mémoire après validation de la transaction,
+puis écrits par lots dans JournalModification (lot plein, fin de requête ou fin
+du processus). Pendant les opérations en masse, ils peuvent être désactivés
+(suspendus) ou regroupés en un événement par modèle et par action.
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import partial
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TAILLE_LOT = 200
+
+_tampon = []
+_verrou = threading.Lock()
+_etat = threading.local()
+
+
+def _mode():
+    return getattr(_etat, 'mode', None)
+
+
+def actif():
+    return getattr(settings, 'RENALOC_JOURNAL_ACTIF', True) and _mode() != 'suspendu'
+
+
+def enregistrer(action, instance=None, modele=None, nombre=1, details=None):
+    """Ajoute un événement ; il n'entre dans le tampon qu'une fois la transaction validée"""
+    if not actif():
+        return
+    modele = modele or instance._meta.model_name
+    if _mode() == 'regroupe':
+        _etat.regroupes[(modele, action)] += nombre
+        _etat.details[(modele, action)].update(details or {})
+        return
+    evenement = {
+        'modele': modele,
+        'action': action,
+        'nombre': nombre,
+        'details': details or {},
+        'date': timezone.now(),
+    }
+    if instance is not None:
+        evenement.update(objet_id=instance.pk, code=instance.code, nom=instance.nom)
+    transaction.on_commit(partial(_ajouter, evenement))
+
+
+def _ajouter(evenement):
+    with _verrou:
+        _tampon.append(evenement)
+        plein = len(_tampon) >= TAILLE_LOT
+    if plein:
+        vider()
+
+
+def vider(**kwargs):
+    """Écrit les événements en attente dans le journal en une seule requête"""
+    global _tampon
+    with _verrou:
+        lot, _tampon = _tampon, []
+    if not lot:
+        return
+    from .models import JournalModification
+    try:
+        JournalModification.objects.bulk_create([JournalModification(**e) for e in lot])
+    except Exception:
+        logger.exception("Écriture du journal Renaloc impossible (%d événement(s) perdus)", len(lot))
+
+
+@contextmanager
+def suspendus():
+    """Désactive les événements (ex. import en masse déjà journalisé globalement)"""
+    precedent = _mode()
+    _etat.mode = 'suspendu'
+    try:
+        yield
+    finally:
+        _etat.mode = precedent
+
+
+@contextmanager
+def regroupes():
+    """Regroupe les événements en un seul par modèle et par action, émis à la sortie"""
+    if _mode() is not None:
+        yield
+        return
+    _etat.mode = 'regroupe'
+    _etat.regroupes = Counter()
+    _etat.details = defaultdict(dict)
+    try:
+        yield
+    finally:
+        _etat.mode = None
+        for (modele, action), nombre in _etat.regroupes.items():
+            details = {**_etat.details[(modele, action)], 'regroupe': True}
+            enregistrer(action, modele=modele, nombre=nombre, details=details)
+        del _etat.regroupes, _etat.details
+
+
+request_finished.connect(vider, dispatch_uid='renaloc_evenements_vider')
+atexit.register(vider)
@@ -0,0 +1,76 @@
+"""
+Export des localités Renaloc en flux (CSV ou XLSX)
+Une seule requête jointe, parcourue par paquets avec .iterator() : la mémoire
+reste constante quel que soit le nombre de quartiers/villages exportés.
+"""
+
+from django.db.models import Count
+from apps.core.exports import CHUNK_SIZE, reponse_csv, reponse_xlsx
+from .models import Region, Departement, Commune, QuartierVillage
+
+# Colonnes (en-tête, champ) de la table aplatie, du niveau le plus haut au plus bas
+COLONNES_REGION = [('Code région', 'code'), ('Région', 'nom')]
+
+NIVEAUX_EXPORT = {
+    'regions': (Region, COLONNES_REGION),
+    'departements': (Departement, [
+        ('Code région', 'region__code'), ('Région', 'region__nom'),
+        ('Code département', 'code'), ('Département', 'nom'),
+    ]),
+    'communes': (Commune, [
+        ('Code région', 'departement__region__code'), ('Région', 'departement__region__nom'),
+        ('Code département', 'departement__code'), ('Département', 'departement__nom'),
+        ('Code commune', 'code'), ('Commune', 'nom'), ('Type', 'type_commune'),
+    ]),
+    'quartiers': (QuartierVillage, [
+        ('Code région', 'commune__departement__region__code'), ('Région', 'commune__departement__region__nom'),
+        ('Code département', 'commune__departement__code'), ('Département', 'commune__departement__nom'),
+        ('Code commune', 'commune__code'), ('Commune', 'commune__nom'), ('Type', 'commune__type_commune'),
+        ('Code quartier/village', 'code'), ('Quartier/Village', 'nom'),
+    ]),
+}
+# « Toutes les données » : la table aplatie complète, une ligne par quartier/village,
+# lue depuis les régions par jointures externes : un département ou une commune sans
+# enfant garde sa ligne (colonnes des niveaux inférieurs vides)
+NIVEAUX_EXPORT['all'] = (Region, [
+    ('Code région', 'code'), ('Région', 'nom'),
+    ('Code département', 'departements__code'), ('Département', 'departements__nom'),
+    ('Code commune', 'departements__communes__code'), ('Commune', 'departements__communes__nom'),
+    ('Type', 'departements__communes__type_commune'),
+    ('Code quartier/village', 'departements__communes__quartiers__code'),
+    ('Quartier/Village', 'departements__communes__quartiers__nom'),
+])
+
+# Tri des lignes : chemin du niveau exporté, ou chemins successifs pour la table complète
+TRI_EXPORT = {
+    'all': ('chemin', 'departements__chemin', 'departements__communes__chemin',
+            'departements__communes__quartiers__chemin'),
+}
+
+
+def lignes_hierarchie(niveau):
+    """En-tête puis lignes de la table aplatie d'un niveau, triées par chemin"""
+    model, colonnes = NIVEAUX_EXPORT[niveau]
+    yield [entete for entete, _ in colonnes]
+    champs = [champ for _, champ in colonnes]
+    tri = TRI_EXPORT.get(niveau, ('chemin',))
+    yield from model.objects.order_by(*tri).values_list(*champs).iterator(chunk_size=CHUNK_SIZE)
+
+
+def export_hierarchie(niveau, format_export):
+    """Réponse d'export d'un niveau ('regions', ..., 'quartiers' ou 'all')"""
+    nom = 'renaloc' if niveau == 'all' else f'renaloc_{niveau}'
+    if format_export == 'csv':
+        return reponse_csv(lignes_hierarchie(niveau), f'{nom}.csv')
+    return reponse_xlsx([(nom, lignes_hierarchie(niveau))], f'{nom}.xlsx')
+
+
+def annoter_pour_export(queryset, *compteurs):
+    """Ajoute les compteurs nécessaires aux exports de l'admin s'ils manquent"""
+    annotations = {
+        'departements_count': Count('departements', distinct=True),
+        'communes_count': Count('communes', distinct=True),
+        'quartiers_count': Count('quartiers', distinct=True),
+    }
+    manquants = {nom: annotations[nom] for nom in compteurs if nom not in queryset.query.annotations}
+    return queryset.annotate(**manquants) if manquants else queryset
@@ -0,0 +1,440 @@
+"""
+Moteur d'import en masse des données Renaloc
+Les codes parents sont résolus une seule fois en mémoire (code -> pk) et les
+lignes sont écrites par lots avec bulk_create / bulk_update
+"""
+
+import csv
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from django.db import transaction
+from django.utils import timezone
+from .models import Region, Departement, Commune, QuartierVillage, normaliser_recherche, propager_chemin
+from . import cache as renaloc_cache
+from . import evenements
+from .references import correspondances
+
+# Ordre de dépendance des niveaux administratifs
+ORDRE_NIVEAUX = ['regions', 'departements', 'communes', 'quartiers']
+
+# Description de chaque niveau : modèle, clé étrangère vers le parent et colonne du fichier
+NIVEAUX = {
+    'regions': {
+        'model': Region,
+        'parent': None,
+        'colonne_parent': None,
+        'libelle': 'régions',
+    },
+    'departements': {
+        'model': Departement,
+        'parent': 'region',
+        'colonne_parent': 'region_code',
+        'libelle': 'départements',
+    },
+    'communes': {
+        'model': Commune,
+        'parent': 'departement',
+        'colonne_parent': 'departement_code',
+        'libelle': 'communes',
+    },
+    'quartiers': {
+        'model': QuartierVillage,
+        'parent': 'commune',
+        'colonne_parent': 'commune_code',
+        'libelle': 'quartiers/villages',
+    },
+}
+
+TYPES_COMMUNE = [choix for choix, _ in Commune.TYPE_CHOICES]
+
+BATCH_SIZE = 1000
+
+# Nombre maximal d'erreurs conservées en mémoire (les suivantes sont seulement comptées)
+MAX_ERREURS = 1000
+
+
+def normaliser_code(valeur):
+    """Convertit une cellule (texte, entier ou flottant Excel) en code texte"""
+    if valeur is None or valeur != valeur:  # None ou NaN
+        return ''
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    return str(valeur).strip()
+
+
+def normaliser_texte(valeur):
+    """Nettoie une cellule texte (None/NaN -> chaîne vide)"""
+    if valeur is None or valeur != valeur:
+        return ''
+    return str(valeur).strip()
+
+
+def lire_lignes(file_path, feuille=None):
+    """
+    Lit un fichier Excel (.xlsx) ou CSV ligne par ligne sans le charger en mémoire.
+    Produit des couples (numéro de ligne, dictionnaire colonne -> valeur).
+    """
+    if os.path.splitext(file_path)[1].lower() == '.csv':
+        yield from _lire_csv(file_path)
+    else:
+        yield from _lire_xlsx(file_path, feuille)
+
+
+def _lire_csv(file_path):
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        echantillon = f.read(4096)
+        f.seek(0)
+        try:
+            dialecte = csv.Sniffer().sniff(echantillon, delimiters=',;\t')
+        except csv.Error:
+            dialecte = csv.excel
+        lecteur = csv.reader(f, dialecte)
+        entetes = [normaliser_texte(h).lower() for h in next(lecteur, [])]
+        for numero, valeurs in enumerate(lecteur, start=2):
+            if any(valeurs):
+                yield numero, dict(zip(entetes, valeurs))
+
+
+def _lire_xlsx(file_path, feuille=None):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb[feuille] if feuille else wb.active
+        lignes = ws.iter_rows(values_only=True)
+        entetes = [normaliser_texte(h).lower() for h in next(lignes, ())]
+        for numero, valeurs in enumerate(lignes, start=2):
+            if any(v is not None for v in valeurs):
+                yield numero, dict(zip(entetes, valeurs))
+    finally:
+        wb.close()
+
+
+def cle_feuille(nom):
+    """Nom de feuille sans accents, espaces ni majuscules ('Régions' -> 'regions')"""
+    nom = unicodedata.normalize('NFKD', str(nom)).encode('ascii', 'ignore').decode()
+    return ''.join(c for c in nom.lower() if c.isalnum())
+
+
+# Noms de feuilles acceptés pour chaque niveau (après cle_feuille)
+ALIAS_FEUILLES = {
+    'regions': {'regions', 'region'},
+    'departements': {'departements', 'departement'},
+    'communes': {'communes', 'commune'},
+    'quartiers': {'quartiers', 'quartier', 'quartiersvillages', 'villages', 'quartiervillage'},
+}
+
+
+def feuilles_par_niveau(file_path):
+    """Associe chaque niveau au nom de la feuille correspondante du classeur"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        noms = wb.sheetnames
+    finally:
+        wb.close()
+    feuilles = {}
+    for nom in noms:
+        for niveau, alias in ALIAS_FEUILLES.items():
+            if cle_feuille(nom) in alias and niveau not in feuilles:
+                feuilles[niveau] = nom
+    return feuilles
+
+
+class EtatImport:
+    """
+    État de reprise d'un import multi-niveaux, stocké à côté du classeur.
+    L'état n'est valable que pour le même fichier (taille et date de modification).
+    """
+
+    def __init__(self, file_path):
+        self.chemin = f"{file_path}.import_renaloc.json"
+        stat = os.stat(file_path)
+        self.signature = f"{stat.st_size}-{int(stat.st_mtime)}"
+        self.niveaux_termines = []
+        if os.path.exists(self.chemin):
+            with open(self.chemin, 'r') as f:
+                etat = json.load(f)
+            if etat.get('signature') == self.signature:
+                self.niveaux_termines = etat.get('niveaux_termines', [])
+
+    def terminer(self, niveau):
+        self.niveaux_termines.append(niveau)
+        with open(self.chemin, 'w') as f:
+            json.dump({'signature': self.signature, 'niveaux_termines': self.niveaux_termines}, f, indent=2)
+
+    def effacer(self):
+        self.niveaux_termines = []
+        if os.path.exists(self.chemin):
+            os.remove(self.chemin)
+
+
+class Progression:
+    """Affiche le nombre de lignes traitées et le débit après chaque lot"""
+
+    def __init__(self, ecrire, libelle):
+        self.ecrire = ecrire
+        self.libelle = libelle
+        self.debut = time.monotonic()
+
+    def __call__(self, lues):
+        duree = max(time.monotonic() - self.debut, 1e-6)
+        self.ecrire(f"  {self.libelle} : {lues} lignes traitées ({int(lues / duree)} lignes/s)")
+
+
+def charger_codes(niveau):
+    """Retourne le dictionnaire code -> pk d'un niveau (depuis les correspondances en mémoire)"""
+    return correspondances.codes(NIVEAUX[niveau]['model']._meta.model_name)
+
+
+class BulkUpsert:
+    """
+    Insère ou met à jour les lignes d'un niveau Renaloc en comparant les codes
+    entrants aux enregistrements existants, sans requête par ligne
+    """
+
+    def __init__(self, niveau, codes_parents=None, batch_size=BATCH_SIZE):
+        self.niveau = niveau
+        self.config = NIVEAUX[niveau]
+        self.model = self.config['model']
+        self.parent = self.config['parent']
+        self.colonne_parent = self.config['colonne_parent']
+        self.batch_size = batch_size
+
+        if self.parent and codes_parents is None:
+            codes_parents = charger_codes(ORDRE_NIVEAUX[ORDRE_NIVEAUX.index(niveau) - 1])
+        self.codes_parents = codes_parents or {}
+        self.chemins_parents = {}
+        if self.parent:
+            model_parent = self.model._meta.get_field(self.parent).related_model
+            self.chemins_parents = dict(model_parent.objects.values_list('pk', 'chemin'))
+
+        self.stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0}
+        self.erreurs = []
+        self.existants = self._charger_existants()
+
+    def _champs(self):
+        """Champs comparés et mis à jour pour ce niveau"""
+        champs = ['nom']
+        if self.parent:
+            champs.append(f'{self.parent}_id')
+        if self.niveau == 'communes':
+            champs.append('type_commune')
+        champs.append('chemin')
+        return champs
+
+    def _charger_existants(self):
+        """Charge en une requête les enregistrements existants : code -> (pk, valeurs)"""
+        champs = self._champs()
+        existants = {}
+        for ligne in self.model.objects.values_list('code', 'pk', *champs).iterator():
+            existants[ligne[0]] = (ligne[1], tuple(ligne[2:]))
+        return existants
+
+    def codes(self):
+        """Dictionnaire code -> pk à jour, réutilisable comme carte parente"""
+        return {code: pk for code, (pk, _) in self.existants.items()}
+
+    def preparer(self, numero, ligne):
+        """
+        Valide une ligne (dictionnaire colonne -> valeur) et retourne
+        (code, valeurs comparables) ou None si la ligne est rejetée
+        """
+        code = normaliser_code(ligne.get('code'))
+        nom = normaliser_texte(ligne.get('nom'))
+        if not code or not nom:
+            self._rejeter(numero, code, "code ou nom manquant")
+            return None
+
+        valeurs = [nom]
+        if self.parent:
+            code_parent = normaliser_code(ligne.get(self.colonne_parent))
+            parent_id = self.codes_parents.get(code_parent)
+            if parent_id is None:
+                self._rejeter(numero, code, f"{self.colonne_parent} inconnu : '{code_parent}'")
+                return None
+            valeurs.append(parent_id)
+        if self.niveau == 'communes':
+            type_commune = normaliser_texte(ligne.get('type')).upper() or 'RURALE'
+            if type_commune not in TYPES_COMMUNE:
+                self._rejeter(numero, code, f"type de commune invalide : '{type_commune}'")
+                return None
+            valeurs.append(type_commune)
+        prefixe = self.chemins_parents.get(valeurs[1], '') if self.parent else '/'
+        valeurs.append(f"{prefixe}{code}/")
+        return code, tuple(valeurs)
+
+    def _rejeter(self, numero, code, message):
+        self.stats['rejected'] += 1
+        if len(self.erreurs) < MAX_ERREURS:
+            self.erreurs.append({'ligne': numero, 'code': code, 'erreur': message})
+
+    def traiter(self, lignes, progression=None):
+        """
+        Traite un itérable de (numéro, ligne) par lots de batch_size.
+        `progression` est appelé après chaque lot avec le nombre de lignes lues.
+        """
+        lot = {}
+        lues = signalees = 0
+        for numero, ligne in lignes:
+            lues += 1
+            prepare = self.preparer(numero, ligne)
+            if prepare:
+                code, valeurs = prepare
+                lot[code] = valeurs
+            if len(lot) >= self.batch_size:
+                self.ecrire_lot(lot)
+                lot = {}
+                if progression:
+                    progression(lues)
+                    signalees = lues
+        if lot:
+            self.ecrire_lot(lot)
+        if progression and lues != signalees:
+            progression(lues)
+        if self.stats['inserted'] or self.stats['updated']:
+            # Un seul événement pour tout le niveau : bulk_create / bulk_update n'émettent pas de signaux
+            evenements.enregistrer(
+                'IMPORT', modele=self.model._meta.model_name,
+                nombre=self.stats['inserted'] + self.stats['updated'], details=dict(self.stats),
+            )
+        return self.stats
+
+    def ecrire_lot(self, lot):
+        """Écrit un lot code -> valeurs dans une transaction"""
+        champs = self._champs()
+        maintenant = timezone.now()
+        a_creer, a_modifier = [], []
+
+        for code, valeurs in lot.items():
+            existant = self.existants.get(code)
+            if existant is None:
+                obj = self.model(code=code, **dict(zip(champs, valeurs)))
+                obj.nom_recherche = normaliser_recherche(obj.nom)
+                a_creer.append(obj)
+            elif existant[1] != valeurs:
+                obj = self.model(pk=existant[0], code=code, **dict(zip(champs, valeurs)))
+                obj.nom_recherche = normaliser_recherche(obj.nom)
+                obj.updated_at = maintenant
+                a_modifier.append(obj)
+            else:
+                self.stats['unchanged'] += 1
+
+        with transaction.atomic():
+            if a_creer:
+                self.model.objects.bulk_create(a_creer, batch_size=self.batch_size)
+            if a_modifier:
+                self.model.objects.bulk_update(
+                    a_modifier, champs + ['nom_recherche', 'updated_at'], batch_size=self.batch_size
+                )
+            # Un niveau déplacé entraîne ses descendants (changement de parent ou de code parent)
+            if self.niveau != 'quartiers':
+                for obj in a_modifier:
+                    ancien_chemin = self.existants[obj.code][1][-1]
+                    if ancien_chemin and ancien_chemin != obj.chemin:
+                        propager_chemin(ancien_chemin, obj.chemin)
+        if a_creer or a_modifier:
+            # bulk_create / bulk_update n'émettent pas de signaux
+            renaloc_cache.invalider(self.model._meta.model_name)
+            correspondances.invalider(self.model._meta.model_name)
+
+        # Certaines bases ne renvoient pas les clés primaires après bulk_create
+        sans_pk = [obj.code for obj in a_creer if obj.pk is None]
+        if sans_pk:
+            pks = dict(self.model.objects.filter(code__in=sans_pk).values_list('code', 'pk'))
+            for obj in a_creer:
+                if obj.pk is None:
+                    obj.pk = pks.get(obj.code)
+
+        for obj in a_creer + a_modifier:
+            self.existants[obj.code] = (obj.pk, lot[obj.code])
+        self.stats['inserted'] += len(a_creer)
+        self.stats['updated'] += len(a_modifier)
+
+
+def hacher(*valeurs):
+    """Empreinte d'une ligne : sha1 des valeurs normalisées"""
+    return hashlib.sha1('\x1f'.join(valeurs).encode('utf-8')).hexdigest()
+
+
+class DiffImport:
+    """
+    Compare un fichier Renaloc à la base sans rien écrire.
+    Chaque ligne est réduite à une empreinte (code, nom, code parent, type_commune)
+    comparée à celle de l'enregistrement existant de même code : un seul passage
+    sur le fichier et une seule requête sur la base. Les lignes que BulkUpsert
+    rejetterait (parent inconnu, type de commune invalide) sont classées invalides.
+    """
+
+    def __init__(self, niveau, codes_parents=None):
+        self.niveau = niveau
+        self.config = NIVEAUX[niveau]
+        self.colonne_parent = self.config['colonne_parent']
+        if self.colonne_parent and codes_parents is None:
+            codes_parents = charger_codes(ORDRE_NIVEAUX[ORDRE_NIVEAUX.index(niveau) - 1])
+        self.codes_parents = set(codes_parents or ())
+        self.existants = self._charger_existants()
+        self.vus = set()
+        self.valides = set()
+        self.rapport = {'added': [], 'modified': [], 'moved': [], 'missing': [], 'invalid': []}
+
+    def _charger_existants(self):
+        """code -> (empreinte, code parent) des enregistrements existants"""
+        parent = self.config['parent']
+        colonnes = ['code', 'nom', f'{parent}__code' if parent else 'code']
+        if self.niveau == 'communes':
+            colonnes.append('type_commune')
+        existants = {}
+        for ligne in self.config['model'].objects.values_list(*colonnes).iterator():
+            code, nom, code_parent = ligne[0], ligne[1], ligne[2] if parent else ''
+            type_commune = ligne[3] if self.niveau == 'communes' else ''
+            existants[code] = (hacher(code, nom, code_parent, type_commune), code_parent)
+        return existants
+
+    def comparer(self, lignes):
+        """Classe chaque ligne entrante : ajoutée, modifiée, déplacée ou inchangée"""
+        for numero, ligne in lignes:
+            code = normaliser_code(ligne.get('code'))
+            nom = normaliser_texte(ligne.get('nom'))
+            if not code or not nom:
+                self.rapport['invalid'].append({'code': code, 'detail': f"ligne {numero} : code ou nom manquant"})
+                continue
+            self.vus.add(code)
+            code_parent = normaliser_code(ligne.get(self.colonne_parent)) if self.colonne_parent else ''
+            if self.colonne_parent and code_parent not in self.codes_parents:
+                self.rapport['invalid'].append({
+                    'code': code, 'detail': f"ligne {numero} : {self.colonne_parent} inconnu : '{code_parent}'",
+                })
+                continue
+            type_commune = ''
+            if self.niveau == 'communes':
+                type_commune = normaliser_texte(ligne.get('type')).upper() or 'RURALE'
+                if type_commune not in TYPES_COMMUNE:
+                    self.rapport['invalid'].append({
+                        'code': code, 'detail': f"ligne {numero} : type de commune invalide : '{type_commune}'",
+                    })
+                    continue
+            self.valides.add(code)
+
+            existant = self.existants.get(code)
+            if existant is None:
+                self.rapport['added'].append({'code': code, 'detail': nom})
+            elif existant[0] != hacher(code, nom, code_parent, type_commune):
+                if existant[1] != code_parent:
+                    detail = f"{self.colonne_parent} : {existant[1]} -> {code_parent}"
+                    self.rapport['moved'].append({'code': code, 'detail': detail})
+                else:
+                    self.rapport['modified'].append({'code': code, 'detail': nom})
+
+        self.rapport['missing'] = [
+            {'code': code, 'detail': ''} for code in self.existants if code not in self.vus
+        ]
+        return self.rapport
+
+    def codes(self):
+        """Codes connus après l'import simulé (existants + lignes valides), parents du niveau suivant"""
+        return set(self.existants) | self.valides
@@ -1,7 +1,14 @@
+import csv
 import pandas as pd
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from apps.renaloc.models import Region, Departement, Commune, QuartierVillage
+from apps.renaloc import evenements
+from apps.renaloc.references import correspondances
+from apps.renaloc.importers import (
+    NIVEAUX, ORDRE_NIVEAUX, BATCH_SIZE, BulkUpsert, DiffImport, EtatImport, Progression,
+    charger_codes, feuilles_par_niveau, lire_lignes,
+)
 
 class Command(BaseCommand):
     help = 'Importe les données Renaloc depuis un fichier Excel'
@@ -9,13 +16,52 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('file_path', type=str, help='Chemin du fichier Excel')
         parser.add_argument('--type', type=str, choices=['regions', 'departements', 'communes', 'quartiers'], 
-                          required=True, help='Type de données à importer')
+                          help='Type de données à importer')
+        parser.add_argument('--complet', action='store_true',
+                          help='Importe tous les niveaux depuis un classeur multi-feuilles '
+                               '(regions, departements, communes, quartiers), avec reprise après échec')
+        parser.add_argument('--recommencer', action='store_true',
+                          help="Avec --complet : ignore l'état de reprise et réimporte tous les niveaux")
+        parser.add_argument('--bulk', action='store_true',
+                          help='Import en masse : codes parents résolus en mémoire, écriture par lots')
+        parser.add_argument('--stream', action='store_true',
+                          help='Lecture en flux (openpyxl read-only ou CSV) avec écriture par lots, mémoire constante')
+        parser.add_argument('--dry-run', action='store_true',
+                          help="N'écrit rien : compare le fichier à la base (ajoutés, modifiés, déplacés, absents)")
+        parser.add_argument('--rapport', type=str,
+                          help='Avec --dry-run : chemin du rapport CSV détaillé à écrire')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                          help=f'Taille des lots pour les modes --bulk et --stream (défaut : {BATCH_SIZE})')
 
-    @transaction.atomic
     def handle(self, *args, **options):
+        # Pas d'événement par ligne pendant l'import : un événement regroupé par modèle et action
+        try:
+            with evenements.regroupes():
+                return self.dispatch(options)
+        finally:
+            evenements.vider()
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"Correspondances code -> id : {correspondances.statistiques()}")
+
+    def dispatch(self, options):
         file_path = options['file_path']
         data_type = options['type']
         
+        if options['dry_run']:
+            return self.handle_dry_run(file_path, data_type, options['complet'], options['rapport'])
+        if options['complet']:
+            return self.handle_complet(file_path, options['batch_size'], options['recommencer'])
+        if not data_type:
+            raise CommandError("--type est obligatoire (sauf avec --complet)")
+        if options['stream']:
+            return self.handle_stream(file_path, data_type, options['batch_size'])
+        if options['bulk']:
+            return self.handle_bulk(file_path, data_type, options['batch_size'])
+        return self.handle_ligne(file_path, data_type)
+
+    @transaction.atomic
+    def handle_ligne(self, file_path, data_type):
+        """Import historique, ligne par ligne avec update_or_create"""
         try:
             df = pd.read_excel(file_path)
             self.stdout.write(f"Importation des {data_type}...")
@@ -30,24 +76,28 @@ class Command(BaseCommand):
                 
             elif data_type == 'departements':
                 for _, row in df.iterrows():
-                    region = Region.objects.get(code=row['region_code'])
+                    region_id = correspondances.id_par_code('region', row['region_code'])
+                    if region_id is None:
+                        raise Region.DoesNotExist(f"Région {row['region_code']} introuvable")
                     Departement.objects.update_or_create(
                         code=row['code'],
                         defaults={
                             'nom': row['nom'],
-                            'region': region
+                            'region_id': region_id
                         }
                     )
                 self.stdout.write(self.style.SUCCESS(f"{len(df)} départements importés"))
                 
             elif data_type == 'communes':
                 for _, row in df.iterrows():
-                    departement = Departement.objects.get(code=row['departement_code'])
+                    departement_id = correspondances.id_par_code('departement', row['departement_code'])
+                    if departement_id is None:
+                        raise Departement.DoesNotExist(f"Département {row['departement_code']} introuvable")
                     Commune.objects.update_or_create(
                         code=row['code'],
                         defaults={
                             'nom': row['nom'],
-                            'departement': departement,
+                            'departement_id': departement_id,
                             'type_commune': row.get('type', 'RURALE')
                         }
                     )
@@ -55,15 +105,140 @@ class Command(BaseCommand):
                 
             elif data_type == 'quartiers':
                 for _, row in df.iterrows():
-                    commune = Commune.objects.get(code=row['commune_code'])
+                    commune_id = correspondances.id_par_code('commune', row['commune_code'])
+                    if commune_id is None:
+                        raise Commune.DoesNotExist(f"Commune {row['commune_code']} introuvable")
                     QuartierVillage.objects.update_or_create(
                         code=row['code'],
                         defaults={
                             'nom': row['nom'],
-                            'commune': commune
+                            'commune_id': commune_id
                         }
                     )
                 self.stdout.write(self.style.SUCCESS(f"{len(df)} quartiers/villages importés"))
                 
         except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Erreur: {str(e)}"))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(f"Erreur: {str(e)}"))
+
+    def handle_bulk(self, file_path, data_type, batch_size):
+        """Import en masse d'un niveau : quelques requêtes par lot au lieu de plusieurs par ligne"""
+        try:
+            df = pd.read_excel(file_path, dtype=str)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Erreur: {str(e)}"))
+            return
+        
+        self.stdout.write(f"Importation en masse des {data_type}...")
+        upsert = BulkUpsert(data_type, batch_size=batch_size)
+        # Numéro de ligne Excel : l'en-tête occupe la ligne 1
+        lignes = enumerate(df.to_dict('records'), start=2)
+        stats = upsert.traiter(lignes)
+        self.afficher_rapport(NIVEAUX[data_type]['libelle'], stats, upsert.erreurs)
+
+    def handle_stream(self, file_path, data_type, batch_size):
+        """Import en flux : les lignes sont lues, validées et écrites lot par lot"""
+        libelle = NIVEAUX[data_type]['libelle']
+        self.stdout.write(f"Importation en flux des {data_type}...")
+        try:
+            upsert = BulkUpsert(data_type, batch_size=batch_size)
+            stats = upsert.traiter(lire_lignes(file_path), progression=Progression(self.stdout.write, libelle))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Erreur: {str(e)}"))
+            return
+        self.afficher_rapport(libelle, stats, upsert.erreurs)
+
+    def handle_complet(self, file_path, batch_size, recommencer=False):
+        """
+        Importe les quatre niveaux d'un classeur dans l'ordre de dépendance.
+        Chaque niveau réutilise la carte code -> pk du niveau précédent ; les niveaux
+        terminés sont enregistrés pour reprendre au bon endroit après un échec.
+        """
+        try:
+            feuilles = feuilles_par_niveau(file_path)
+        except Exception as e:
+            raise CommandError(f"Lecture du classeur impossible : {e}")
+        manquantes = [niveau for niveau in ORDRE_NIVEAUX if niveau not in feuilles]
+        if manquantes:
+            raise CommandError(f"Feuille(s) manquante(s) : {', '.join(manquantes)}")
+        
+        etat = EtatImport(file_path)
+        if recommencer:
+            etat.effacer()
+        elif etat.niveaux_termines:
+            self.stdout.write(f"Reprise : niveaux déjà importés : {', '.join(etat.niveaux_termines)}")
+        
+        codes_parents = None
+        for niveau in ORDRE_NIVEAUX:
+            libelle = NIVEAUX[niveau]['libelle']
+            if niveau in etat.niveaux_termines:
+                codes_parents = charger_codes(niveau)
+                continue
+            
+            self.stdout.write(f"Importation des {libelle} (feuille '{feuilles[niveau]}')...")
+            upsert = BulkUpsert(niveau, codes_parents=codes_parents, batch_size=batch_size)
+            try:
+                stats = upsert.traiter(
+                    lire_lignes(file_path, feuilles[niveau]),
+                    progression=Progression(self.stdout.write, libelle),
+                )
+            except Exception as e:
+                raise CommandError(
+                    f"Échec pendant l'import des {libelle} : {e}. "
+                    f"Relancez la même commande pour reprendre à ce niveau."
+                )
+            self.afficher_rapport(libelle, stats, upsert.erreurs)
+            etat.terminer(niveau)
+            codes_parents = upsert.codes()
+        
+        etat.effacer()
+        self.stdout.write(self.style.SUCCESS("Import complet terminé"))
+
+    def handle_dry_run(self, file_path, data_type, complet, chemin_rapport=None):
+        """Affiche ce que changerait l'import, sans toucher à la base"""
+        if complet:
+            feuilles = feuilles_par_niveau(file_path)
+            niveaux = [(niveau, feuilles[niveau]) for niveau in ORDRE_NIVEAUX if niveau in feuilles]
+        elif data_type:
+            niveaux = [(data_type, None)]
+        else:
+            raise CommandError("--type est obligatoire (sauf avec --complet)")
+        
+        lignes_rapport = []
+        codes_simules = {}
+        for niveau, feuille in niveaux:
+            # En --complet, les codes ajoutés au niveau précédent sont des parents valides
+            index = ORDRE_NIVEAUX.index(niveau)
+            diff = DiffImport(niveau, codes_simules.get(ORDRE_NIVEAUX[index - 1]) if index else None)
+            rapport = diff.comparer(lire_lignes(file_path, feuille))
+            codes_simules[niveau] = diff.codes()
+            self.stdout.write(
+                f"{NIVEAUX[niveau]['libelle']} : {len(rapport['added'])} ajoutés, "
+                f"{len(rapport['modified'])} modifiés, {len(rapport['moved'])} déplacés, "
+                f"{len(rapport['missing'])} absents du fichier, {len(rapport['invalid'])} invalides"
+            )
+            for statut in ['added', 'modified', 'moved', 'missing', 'invalid']:
+                for entree in rapport[statut]:
+                    lignes_rapport.append([niveau, statut, entree['code'], entree['detail']])
+                for entree in rapport[statut][:10]:
+                    self.stdout.write(f"  [{statut}] {entree['code']} {entree['detail']}".rstrip())
+        
+        if chemin_rapport:
+            with open(chemin_rapport, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['niveau', 'statut', 'code', 'detail'])
+                writer.writerows(lignes_rapport)
+            self.stdout.write(self.style.SUCCESS(f"Rapport écrit : {chemin_rapport}"))
+        self.stdout.write(self.style.WARNING("Simulation (--dry-run) : aucune donnée modifiée"))
+
+    def afficher_rapport(self, libelle, stats, erreurs):
+        """Affiche le bilan inséré / modifié / inchangé / rejeté d'un niveau"""
+        self.stdout.write(self.style.SUCCESS(
+            f"{libelle} : {stats['inserted']} insérés, {stats['updated']} modifiés, "
+            f"{stats['unchanged']} inchangés"
+        ))
+        if stats['rejected']:
+            self.stdout.write(self.style.WARNING(f"{stats['rejected']} ligne(s) rejetée(s) :"))
+            for erreur in erreurs[:20]:
+                self.stdout.write(f"  ligne {erreur['ligne']} ({erreur['code'] or '-'}) : {erreur['erreur']}")
+            if stats['rejected'] > 20:
+                self.stdout.write(f"  ... et {stats['rejected'] - 20} autre(s)")
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:53
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normaliser_recherche(texte):
+    texte = unicodedata.normalize('NFKD', texte or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return ' '.join(texte.lower().split())
+
+
+def remplir_nom_recherche(apps, schema_editor):
+    for nom_modele in ('Region', 'Departement', 'Commune', 'QuartierVillage'):
+        model = apps.get_model('renaloc', nom_modele)
+        objets = list(model.objects.only('id', 'nom'))
+        for obj in objets:
+            obj.nom_recherche = normaliser_recherche(obj.nom)
+        model.objects.bulk_update(objets, ['nom_recherche'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renaloc', '0003_alter_commune_code_alter_departement_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commune',
+            name='nom_recherche',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='departement',
+            name='nom_recherche',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='quartiervillage',
+            name='nom_recherche',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='nom_recherche',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(remplir_nom_recherche, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+def remplir_chemin(apps, schema_editor):
+    chemins = {}
+    for nom_modele, parent in (('Region', None), ('Departement', 'region'),
+                               ('Commune', 'departement'), ('QuartierVillage', 'commune')):
+        model = apps.get_model('renaloc', nom_modele)
+        champs = ['id', 'code'] + ([parent] if parent else [])
+        objets = list(model.objects.only(*champs))
+        for obj in objets:
+            prefixe = chemins[getattr(obj, f'{parent}_id')] if parent else '/'
+            obj.chemin = f"{prefixe}{obj.code}/"
+        model.objects.bulk_update(objets, ['chemin'], batch_size=1000)
+        chemins = {obj.id: obj.chemin for obj in objets}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renaloc', '0004_nom_recherche'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commune',
+            name='chemin',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='departement',
+            name='chemin',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='quartiervillage',
+            name='chemin',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='chemin',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=30),
+        ),
+        migrations.RunPython(remplir_chemin, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('renaloc', '0005_chemin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalModification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(max_length=50)),
+                ('objet_id', models.BigIntegerField(blank=True, null=True)),
+                ('code', models.CharField(blank=True, max_length=20)),
+                ('nom', models.CharField(blank=True, max_length=100)),
+                ('action', models.CharField(choices=[('CREATION', 'Création'), ('MODIFICATION', 'Modification'), ('SUPPRESSION', 'Suppression'), ('IMPORT', 'Import en masse')], max_length=20)),
+                ('nombre', models.IntegerField(default=1)),
+                ('details', models.JSONField(blank=True, default=dict)),
+                ('date', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Journal des modifications',
+                'verbose_name_plural': 'Journal des modifications',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -1,18 +1,58 @@
-from django.db import models
+import unicodedata
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.core.validators import RegexValidator
 from django.utils import timezone
+from . import cache as renaloc_cache
 
 # Autorise uniquement les lettres (minuscules/majuscules)
 alpha_only = RegexValidator(r'^[a-zA-Z]*$', 'Seules les lettres sont autorisées.')
 # Autorise uniquement les chiffres
 chiffre_only = RegexValidator(r'^[0-9]*$', 'Seuls les chiffres sont autorisés.')
 
+def normaliser_recherche(texte):
+    """Clé de recherche : minuscules, sans accents, espaces simples ('Tillabéri' -> 'tillaberi')"""
+    texte = unicodedata.normalize('NFKD', texte or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c))
+    return ' '.join(texte.lower().split())
+
+def sous_chemin(prefixe):
+    """
+    Conditions « chemin commence par `prefixe` » sous forme d'intervalle sur l'index :
+    le préfixe finit par '/' et '0' est le caractère suivant, donc tous les chemins
+    descendants sont compris entre `prefixe` et `prefixe` terminé par '0'
+    (chemin__startswith devient un LIKE sous SQLite, qui n'utilise pas l'index)
+    """
+    return {'chemin__gte': prefixe, 'chemin__lt': prefixe[:-1] + '0'}
+
+class LocaliteQuerySet(models.QuerySet):
+    def dans(self, localite):
+        """Localités situées sous `localite` (intervalle sur le chemin indexé)"""
+        return self.filter(**sous_chemin(localite.chemin))
+
+def propager_chemin(ancien, nouveau):
+    """Remplace le préfixe `ancien` par `nouveau` dans le chemin de tous les descendants"""
+    modifies = []
+    for model in (Departement, Commune, QuartierVillage):
+        if model.objects.filter(**sous_chemin(ancien)).update(
+            chemin=Concat(Value(nouveau), Substr('chemin', len(ancien) + 1))
+        ):
+            modifies.append(model._meta.model_name)
+    if modifies:
+        # update() n'émet pas de signaux : les descendants changent aussi de génération
+        transaction.on_commit(lambda: renaloc_cache.invalider(*modifies))
+
 class Region(models.Model):
     code = models.CharField(max_length=2, unique=True, validators=[chiffre_only]) # Code à 2 caractères pour les régions
     nom = models.CharField(max_length=100) # Nom de la région, limité à 50 caractères
+    nom_recherche = models.CharField(max_length=100, blank=True, editable=False, db_index=True) # Nom normalisé pour la recherche
+    chemin = models.CharField(max_length=30, blank=True, editable=False, db_index=True) # Codes des ancêtres, ex. /01/101/10101/
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     
+    objects = LocaliteQuerySet.as_manager()
+    
     class Meta:
         ordering = ['nom']
         verbose_name = "Région"
@@ -20,14 +60,26 @@ class Region(models.Model):
     
     def __str__(self):
         return f"{self.nom}"
+    
+    def save(self, *args, **kwargs):
+        self.nom_recherche = normaliser_recherche(self.nom)
+        ancien_chemin = self.chemin if self.pk else ''
+        self.chemin = f"/{self.code}/"
+        super().save(*args, **kwargs)
+        if ancien_chemin and ancien_chemin != self.chemin:
+            propager_chemin(ancien_chemin, self.chemin)
 
 class Departement(models.Model):
     code = models.CharField(max_length=3, unique=True, validators=[chiffre_only]) # Code numérique unique pour chaque département  
     nom = models.CharField(max_length=100)
+    nom_recherche = models.CharField(max_length=100, blank=True, editable=False, db_index=True) # Nom normalisé pour la recherche
+    chemin = models.CharField(max_length=30, blank=True, editable=False, db_index=True) # Codes des ancêtres, ex. /01/101/10101/
     region = models.ForeignKey(Region, on_delete=models.CASCADE, related_name='departements')
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     
+    objects = LocaliteQuerySet.as_manager()
+    
     class Meta:
         ordering = ['nom']
         verbose_name = "Département"
@@ -35,10 +87,20 @@ class Departement(models.Model):
     
     def __str__(self):
         return f"{self.nom} ({self.region.nom})"
+    
+    def save(self, *args, **kwargs):
+        self.nom_recherche = normaliser_recherche(self.nom)
+        ancien_chemin = self.chemin if self.pk else ''
+        self.chemin = f"{self.region.chemin}{self.code}/"
+        super().save(*args, **kwargs)
+        if ancien_chemin and ancien_chemin != self.chemin:
+            propager_chemin(ancien_chemin, self.chemin)
 
 class Commune(models.Model):
     code = models.CharField(max_length=5, unique=True, validators=[chiffre_only]) # Code numérique unique pour chaque commune
     nom = models.CharField(max_length=100)
+    nom_recherche = models.CharField(max_length=100, blank=True, editable=False, db_index=True) # Nom normalisé pour la recherche
+    chemin = models.CharField(max_length=30, blank=True, editable=False, db_index=True) # Codes des ancêtres, ex. /01/101/10101/
     departement = models.ForeignKey(Departement, on_delete=models.CASCADE, related_name='communes')
     TYPE_CHOICES = [
         ('URBAINE', 'Urbaine'),
@@ -48,6 +110,8 @@ class Commune(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     
+    objects = LocaliteQuerySet.as_manager()
+    
     class Meta:
         ordering = ['nom']
         verbose_name = "Commune"
@@ -55,18 +119,60 @@ class Commune(models.Model):
     
     def __str__(self):
         return f"{self.nom} ({self.departement.nom})"
+    
+    def save(self, *args, **kwargs):
+        self.nom_recherche = normaliser_recherche(self.nom)
+        ancien_chemin = self.chemin if self.pk else ''
+        self.chemin = f"{self.departement.chemin}{self.code}/"
+        super().save(*args, **kwargs)
+        if ancien_chemin and ancien_chemin != self.chemin:
+            propager_chemin(ancien_chemin, self.chemin)
 
 class QuartierVillage(models.Model):
     code = models.CharField(max_length=8, unique=True, validators=[chiffre_only]) # Code numérique unique pour chaque quartier/village
     nom = models.CharField(max_length=100)
+    nom_recherche = models.CharField(max_length=100, blank=True, editable=False, db_index=True) # Nom normalisé pour la recherche
+    chemin = models.CharField(max_length=30, blank=True, editable=False, db_index=True) # Codes des ancêtres, ex. /01/101/10101/
     commune = models.ForeignKey(Commune, on_delete=models.CASCADE, related_name='quartiers')
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     
+    objects = LocaliteQuerySet.as_manager()
+    
     class Meta:
         ordering = ['nom']
         verbose_name = "Quartier/Village"
         verbose_name_plural = "Quartiers/Villages"
     
     def __str__(self):
-        return f"{self.nom} ({self.commune.nom})"
\ No newline at end of file
+        return f"{self.nom} ({self.commune.nom})"
+    
+    def save(self, *args, **kwargs):
+        self.nom_recherche = normaliser_recherche(self.nom)
+        self.chemin = f"{self.commune.chemin}{self.code}/"
+        super().save(*args, **kwargs)
+
+class JournalModification(models.Model):
+    """Journal des modifications des localités (ajout seulement, écrit par lots)"""
+    ACTION_CHOICES = [
+        ('CREATION', 'Création'),
+        ('MODIFICATION', 'Modification'),
+        ('SUPPRESSION', 'Suppression'),
+        ('IMPORT', 'Import en masse'),
+    ]
+    modele = models.CharField(max_length=50)
+    objet_id = models.BigIntegerField(null=True, blank=True)
+    code = models.CharField(max_length=20, blank=True)
+    nom = models.CharField(max_length=100, blank=True)
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    nombre = models.IntegerField(default=1) # Nombre d'événements regroupés dans cette entrée
+    details = models.JSONField(default=dict, blank=True)
+    date = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['-date']
+        verbose_name = "Journal des modifications"
+        verbose_name_plural = "Journal des modifications"
+    
+    def __str__(self):
+        return f"{self.get_action_display()} {self.modele} {self.code}".strip()
@@ -0,0 +1,106 @@
+"""
+Index de recherche en mémoire des localités Renaloc
+Construit une fois par processus à partir de la colonne nom_recherche, puis
+reconstruit seulement quand une localité change (générations de cache.py).
+"""
+
+from bisect import bisect_left, bisect_right
+from .models import Region, Departement, Commune, QuartierVillage, normaliser_recherche
+from . import cache as renaloc_cache
+
+# (type, modèle, libellé, champ donnant le contexte affiché entre parenthèses)
+TYPES = [
+    ('region', Region, 'Région', None),
+    ('departement', Departement, 'Département', 'region__nom'),
+    ('commune', Commune, 'Commune', 'departement__nom'),
+    ('quartier', QuartierVillage, 'Quartier/Village', 'commune__nom'),
+]
+
+LIMITE_PAR_TYPE = 5
+LONGUEUR_MIN_SOUS_CHAINE = 2
+
+# Rangs : correspondance exacte, préfixe du nom, début d'un mot, sous-chaîne
+EXACT, PREFIXE, DEBUT_MOT, CONTIENT = range(4)
+
+_index = {'version': None, 'index': None}
+
+
+class IndexRecherche:
+    """Pour chaque type, liste triée des clés normalisées et entrées associées"""
+
+    def __init__(self):
+        self.types = {}
+        for type_, model, libelle, contexte in TYPES:
+            colonnes = ['nom_recherche', 'id', 'code', 'nom']
+            if contexte:
+                colonnes.append(contexte)
+            lignes = sorted(model.objects.order_by().values_list(*colonnes).iterator())
+            cles = [ligne[0] for ligne in lignes]
+            # Toutes les clés dans une seule chaîne pour des recherches de sous-chaîne en C
+            texte = '\n'.join(cles)
+            debuts, position = [], 0
+            for cle in cles:
+                debuts.append(position)
+                position += len(cle) + 1
+            self.types[type_] = (libelle, cles, lignes, texte, debuts)
+
+    def rechercher(self, terme, limite=LIMITE_PAR_TYPE):
+        """Résultats classés (exact, préfixe, début de mot, sous-chaîne), au plus `limite` par type"""
+        cle = normaliser_recherche(terme)
+        if not cle:
+            return []
+
+        resultats = []
+        for ordre, (type_, _, _, _) in enumerate(TYPES):
+            libelle, cles, lignes, texte, debuts = self.types[type_]
+            trouves = []
+
+            # Préfixes : recherche dichotomique dans les clés triées
+            i = bisect_left(cles, cle)
+            while i < len(cles) and cles[i].startswith(cle) and len(trouves) < limite:
+                trouves.append((EXACT if cles[i] == cle else PREFIXE, i))
+                i += 1
+
+            # Début de mot puis sous-chaîne : seulement si les préfixes ne suffisent pas
+            # (inutile pour un seul caractère, qui correspondrait à presque tout)
+            if len(trouves) < limite and len(cle) >= LONGUEUR_MIN_SOUS_CHAINE:
+                deja = {j for _, j in trouves}
+                autres = {}
+                position = texte.find(cle)
+                while position != -1:
+                    j = bisect_right(debuts, position) - 1
+                    decalage = position - debuts[j]
+                    if decalage > 0 and j not in deja:
+                        rang = DEBUT_MOT if not cles[j][decalage - 1].isalnum() else CONTIENT
+                        if rang < autres.get(j, (CONTIENT + 1,))[0]:
+                            autres[j] = (rang, len(cles[j]), j)
+                    position = texte.find(cle, position + 1)
+                autres = sorted(autres.values())
+                trouves.extend((rang, j) for rang, _, j in autres[:limite - len(trouves)])
+
+            for rang, j in trouves:
+                ligne = lignes[j]
+                contexte = f" ({ligne[4]})" if len(ligne) > 4 and ligne[4] else ""
+                resultats.append({
+                    'label': f"{libelle}: {ligne[3]}{contexte}",
+                    'value': ligne[3],
+                    'type': type_,
+                    'id': ligne[1],
+                    'code': ligne[2],
+                    'rang': rang,
+                    '_ordre': ordre,
+                })
+
+        resultats.sort(key=lambda r: (r['rang'], r['_ordre'], len(r['value'])))
+        for resultat in resultats:
+            del resultat['_ordre']
+        return resultats
+
+
+def index_recherche():
+    """Index courant, reconstruit si une localité a changé depuis sa construction"""
+    version = tuple(renaloc_cache.generation(modele) for modele in renaloc_cache.MODELES)
+    if _index['version'] != version:
+        _index['index'] = IndexRecherche()
+        _index['version'] = version
+    return _index['index']
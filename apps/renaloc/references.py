@@ -0,0 +1,93 @@
+"""
+Correspondances en mémoire des localités Renaloc : code -> id et id -> parent
+Chargées une fois par processus et par niveau. Les signaux post_save / post_delete
+les invalident dans le processus courant ; les changements faits par d'autres
+processus sont vus via la génération du modèle (cache.py), relue au plus une
+fois par DELAI_VERIFICATION secondes.
+"""
+
+import threading
+import time
+from .models import Region, Departement, Commune, QuartierVillage
+from . import cache as renaloc_cache
+
+# Nom du modèle -> (modèle, champ du parent)
+NIVEAUX = {
+    'region': (Region, None),
+    'departement': (Departement, 'region_id'),
+    'commune': (Commune, 'departement_id'),
+    'quartiervillage': (QuartierVillage, 'commune_id'),
+}
+
+DELAI_VERIFICATION = 1.0
+
+
+class Correspondances:
+    """Tables code -> id et id -> parent_id par niveau, partagées par le processus"""
+
+    def __init__(self):
+        self._tables = {}
+        self._verrou = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _table(self, modele):
+        table = self._tables.get(modele)
+        maintenant = time.monotonic()
+        if table is not None and maintenant - table[3] < DELAI_VERIFICATION:
+            self.hits += 1
+            return table
+        generation = renaloc_cache.generation(modele)
+        if table is not None and table[0] == generation:
+            self._tables[modele] = table[:3] + (maintenant,)
+            self.hits += 1
+            return table
+        with self._verrou:
+            table = self._tables.get(modele)
+            if table is None or table[0] != generation:
+                self.misses += 1
+                model, champ_parent = NIVEAUX[modele]
+                champs = ['code', 'pk'] + ([champ_parent] if champ_parent else [])
+                codes, parents = {}, {}
+                for ligne in model.objects.order_by().values_list(*champs).iterator():
+                    codes[ligne[0]] = ligne[1]
+                    if champ_parent:
+                        parents[ligne[1]] = ligne[2]
+                table = (generation, codes, parents, maintenant)
+                self._tables[modele] = table
+            else:
+                self.hits += 1
+        return table
+
+    def id_par_code(self, modele, code):
+        """Identifiant de la localité de ce code, ou None"""
+        return self._table(modele)[1].get(str(code))
+
+    def parent_id(self, modele, pk):
+        """Identifiant du parent d'une localité, ou None"""
+        return self._table(modele)[2].get(pk)
+
+    def codes(self, modele):
+        """Copie du dictionnaire code -> id d'un niveau (pour les traitements en masse)"""
+        return dict(self._table(modele)[1])
+
+    def parents(self, modele):
+        """Copie du dictionnaire id -> parent_id d'un niveau (pour les traitements en masse)"""
+        return dict(self._table(modele)[2])
+
+    def invalider(self, *modeles):
+        """Oublie les tables chargées (toutes par défaut)"""
+        with self._verrou:
+            for modele in modeles or list(self._tables):
+                self._tables.pop(modele, None)
+
+    def statistiques(self):
+        """Compteurs de succès / échecs et taille des tables chargées"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'tables': {modele: len(table[1]) for modele, table in self._tables.items()},
+        }
+
+
+correspondances = Correspondances()
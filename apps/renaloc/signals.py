@@ -1,23 +1,33 @@
+from functools import partial
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-from django.contrib import messages
 from .models import Region, Departement, Commune, QuartierVillage
+from . import cache as renaloc_cache
+from . import evenements
+from .references import correspondances
 
-@receiver(post_save, sender=Region)
-def region_saved(sender, instance, created, **kwargs):
-    """Action après la sauvegarde d'une région"""
-    if created:
-        print(f"✅ Nouvelle région créée : {instance.nom}")
-    else:
-        print(f"✏️ Région modifiée : {instance.nom}")
 
-@receiver(post_save, sender=Departement)
-def departement_saved(sender, instance, created, **kwargs):
-    """Action après la sauvegarde d'un département"""
-    if created:
-        print(f"✅ Nouveau département créé : {instance.nom} dans {instance.region.nom}")
+def localite_enregistree(sender, instance, created, **kwargs):
+    """Journalise la création ou la modification d'une localité"""
+    evenements.enregistrer('CREATION' if created else 'MODIFICATION', instance)
 
-@receiver(post_delete, sender=Commune)
-def commune_deleted(sender, instance, **kwargs):
-    """Action après la suppression d'une commune"""
-    print(f"❌ Commune supprimée : {instance.nom}")
\ No newline at end of file
+def localite_supprimee(sender, instance, **kwargs):
+    """Journalise la suppression d'une localité"""
+    evenements.enregistrer('SUPPRESSION', instance)
+
+def invalider_cache_renaloc(sender, instance, **kwargs):
+    """Invalide le cache des vues Renaloc et les correspondances du modèle modifié"""
+    nom = sender._meta.model_name
+    # Correspondances du processus : tout de suite (lectures dans la même transaction)
+    correspondances.invalider(nom)
+    # Génération partagée : après la validation, sinon une autre requête pourrait
+    # remettre en cache les données d'avant sous la nouvelle génération
+    transaction.on_commit(partial(renaloc_cache.invalider, nom))
+    transaction.on_commit(partial(correspondances.invalider, nom))
+
+for model in (Region, Departement, Commune, QuartierVillage):
+    nom = model._meta.model_name
+    post_save.connect(localite_enregistree, sender=model, dispatch_uid=f'renaloc_journal_save_{nom}')
+    post_delete.connect(localite_supprimee, sender=model, dispatch_uid=f'renaloc_journal_delete_{nom}')
+    post_save.connect(invalider_cache_renaloc, sender=model, dispatch_uid=f'renaloc_cache_save_{nom}')
+    post_delete.connect(invalider_cache_renaloc, sender=model, dispatch_uid=f'renaloc_cache_delete_{nom}')
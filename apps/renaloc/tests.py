@@ -0,0 +1,183 @@
+import io
+import re
+import unittest
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import cache as renaloc_cache
+from . import evenements
+from .models import Region, Departement, Commune, QuartierVillage, JournalModification, propager_chemin
+
+
+class ChangelistRequetesTest(TestCase):
+    """Le nombre de requêtes des listes d'administration ne dépend pas du nombre de localités"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        cls.region = Region.objects.create(code='01', nom='Agadez')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def ajouter_localites(self, nombre):
+        debut = Departement.objects.count() + 1
+        for rang in range(debut, debut + nombre):
+            departement = Departement.objects.create(code=f'{100 + rang}', nom=f'Département {rang}', region=self.region)
+            commune = Commune.objects.create(code=f'{100 + rang}01', nom=f'Commune {rang}', departement=departement)
+            QuartierVillage.objects.create(code=f'{100 + rang}01001', nom=f'Quartier {rang}', commune=commune)
+
+    def compter_requetes(self, url):
+        with CaptureQueriesContext(connection) as requetes:
+            reponse = self.client.get(url)
+        self.assertEqual(reponse.status_code, 200)
+        return len(requetes)
+
+    def verifier_constant(self, nom_url):
+        url = reverse(nom_url)
+        self.ajouter_localites(2)
+        attendu = self.compter_requetes(url)
+        self.ajouter_localites(10)
+        with self.assertNumQueries(attendu):
+            self.client.get(url)
+
+    def test_liste_communes(self):
+        self.verifier_constant('admin:renaloc_commune_changelist')
+
+    def test_liste_quartiers(self):
+        self.verifier_constant('admin:renaloc_quartiervillage_changelist')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Plans EXPLAIN QUERY PLAN propres à SQLite")
+class CheminTest(TestCase):
+    """Les recherches de sous-arbre passent par l'index du chemin"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        cls.regions = [Region.objects.create(code=code, nom=f'Région {code}') for code in ('01', '02')]
+        for region in cls.regions:
+            for rang in (1, 2):
+                departement = Departement.objects.create(
+                    code=f'{region.code[-1]}0{rang}', nom=f'Département {region.code}-{rang}', region=region
+                )
+                commune = Commune.objects.create(code=f'{departement.code}01', nom=f'Commune {departement.code}',
+                                                 departement=departement)
+                for numero in (1, 2):
+                    QuartierVillage.objects.create(code=f'{commune.code}00{numero}',
+                                                   nom=f'Quartier {commune.code}-{numero}', commune=commune)
+
+    def plans(self, fonction):
+        """Plans (table, plan) des requêtes exécutées par `fonction`"""
+        with CaptureQueriesContext(connection) as requetes:
+            fonction()
+        plans = []
+        with connection.cursor() as cursor:
+            for requete in requetes:
+                cursor.execute(f"EXPLAIN QUERY PLAN {requete['sql']}")
+                plans.append('\n'.join(ligne[-1] for ligne in cursor.fetchall()))
+        return plans
+
+    def verifier_index(self, model, plans):
+        table = re.escape(model._meta.db_table)
+        for plan in plans:
+            with self.subTest(table=model._meta.db_table, plan=plan):
+                self.assertRegex(plan, rf'\bSEARCH {table} USING (?:COVERING )?INDEX\b')
+                self.assertNotRegex(plan, rf'\bSCAN {table}\b')
+
+    def test_dans(self):
+        region = self.regions[0]
+        self.assertEqual(
+            set(QuartierVillage.objects.dans(region).values_list('code', flat=True)),
+            set(QuartierVillage.objects.filter(commune__departement__region=region).values_list('code', flat=True)),
+        )
+        for model in (Departement, Commune, QuartierVillage):
+            self.verifier_index(model, self.plans(lambda: list(model.objects.dans(region))))
+
+    def test_propager_chemin(self):
+        region = self.regions[0]
+        plans = self.plans(lambda: propager_chemin(region.chemin, '/09/'))
+        self.assertEqual(len(plans), 3)
+        for model, plan in zip((Departement, Commune, QuartierVillage), plans):
+            self.verifier_index(model, [plan])
+        self.assertEqual(QuartierVillage.objects.filter(chemin__startswith='/09/').count(), 4)
+        self.assertFalse(QuartierVillage.objects.filter(chemin__startswith=region.chemin).exists())
+
+    def test_filtre_admin_par_region(self):
+        self.client.force_login(self.admin)
+        region = self.regions[1]
+        reponse = self.client.get(reverse('admin:renaloc_quartiervillage_changelist'),
+                                  {'commune__departement__region__id__exact': region.pk})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(
+            {quartier.code for quartier in reponse.context['cl'].result_list},
+            set(QuartierVillage.objects.filter(commune__departement__region=region).values_list('code', flat=True)),
+        )
+
+
+class ExportHierarchieTest(TestCase):
+    """Export de la table aplatie complète"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        region = Region.objects.create(code='01', nom='Agadez')
+        departement = Departement.objects.create(code='101', nom='Arlit', region=region)
+        commune = Commune.objects.create(code='10101', nom='Arlit', departement=departement)
+        QuartierVillage.objects.create(code='10101001', nom='Quartier 1', commune=commune)
+        # Parents sans enfant : doivent rester dans l'export
+        Commune.objects.create(code='10102', nom='Dannet', departement=departement)
+        Departement.objects.create(code='102', nom='Bilma', region=region)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_xlsx_complet_garde_les_parents_sans_enfant(self):
+        reponse = self.client.get(reverse('renaloc:export_data'), {'type': 'all', 'format': 'excel'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertTrue(reponse.streaming)
+        classeur = openpyxl.load_workbook(io.BytesIO(b''.join(reponse.streaming_content)))
+        lignes = list(classeur.active.iter_rows(values_only=True))
+        self.assertEqual(lignes[0][0], 'Code région')
+        self.assertEqual([ligne[2::2] for ligne in lignes[1:]], [
+            ('101', '10101', 'RURALE', 'Quartier 1'),
+            ('101', '10102', 'RURALE', None),
+            ('102', None, None, None),
+        ])
+
+
+class ActionsCommuneTest(TestCase):
+    """Actions en masse de l'admin des communes (UPDATE sans post_save)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        region = Region.objects.create(code='01', nom='Agadez')
+        departement = Departement.objects.create(code='101', nom='Arlit', region=region)
+        cls.communes = [
+            Commune.objects.create(code=f'1010{rang}', nom=f'Commune {rang}', departement=departement)
+            for rang in (1, 2)
+        ]
+
+    def test_marquer_urbain_journalise_et_invalide_apres_validation(self):
+        self.client.force_login(self.admin)
+        evenements.vider()
+        generation = renaloc_cache.generation('commune')
+        with self.captureOnCommitCallbacks() as rappels:
+            self.client.post(reverse('admin:renaloc_commune_changelist'), {
+                'action': 'marquer_urbain', '_selected_action': [commune.pk for commune in self.communes],
+            })
+        self.assertEqual(Commune.objects.filter(type_commune='URBAINE').count(), 2)
+        # Rien n'est publié avant la validation
+        self.assertEqual(renaloc_cache.generation('commune'), generation)
+        for rappel in rappels:
+            rappel()
+        evenements.vider()
+        self.assertNotEqual(renaloc_cache.generation('commune'), generation)
+        journal = JournalModification.objects.filter(modele='commune', action='MODIFICATION')
+        self.assertEqual(set(journal.values_list('code', flat=True)), {'10101', '10102'})
+        self.assertEqual(journal.first().details, {'type_commune': 'URBAINE'})
@@ -15,4 +15,5 @@ urlpatterns = [
     # Nouvelles URLs pour les départements et quartiers
     path('get-departements/', views.get_departements, name='get_departements'),
     path('get-quartiers/', views.get_quartiers, name='get_quartiers'),
+    path('hierarchie/', views.hierarchie, name='hierarchie'),
 ]
\ No newline at end of file
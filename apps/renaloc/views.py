@@ -1,9 +1,18 @@
-from django.shortcuts import render
+import hashlib
+import json
+from django.shortcuts import render, redirect
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Count
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
 from .models import Region, Departement, Commune, QuartierVillage
+from . import cache as renaloc_cache
+from . import exports
+from .recherche import LIMITE_PAR_TYPE, index_recherche
 
 @login_required
 def import_export(request):
@@ -11,28 +20,36 @@ def import_export(request):
 
 @login_required
 def export_data(request):
-    # Logique d'export à implémenter
-    from django.http import HttpResponse
-    return HttpResponse("Export en cours de développement")
+    """Export en flux de la hiérarchie (table aplatie ou un seul niveau)"""
+    niveau = request.GET.get('type', 'all')
+    format_export = request.GET.get('format', 'excel')
+    if niveau not in exports.NIVEAUX_EXPORT or format_export not in ('excel', 'csv'):
+        messages.error(request, "Type ou format d'export invalide")
+        return redirect('renaloc:import_export')
+    return exports.export_hierarchie(niveau, format_export)
 
 
 @staff_member_required
 def admin_stats(request):
     """Vue pour les statistiques en temps réel dans l'admin"""
-    stats = {
+    stats = renaloc_cache.get_or_set('admin_stats', renaloc_cache.MODELES, lambda: {
         'regions': Region.objects.count(),
         'departements': Departement.objects.count(),
         'communes': Commune.objects.count(),
         'quartiers': QuartierVillage.objects.count(),
-    }
+    })
     return JsonResponse(stats)
+
 @staff_member_required
 def get_departements(request):
     """Vue pour obtenir les départements d'une région"""
     region_id = request.GET.get('region_id')
     if region_id:
-        departements = Departement.objects.filter(region_id=region_id).values('id', 'nom', 'code')
-        return JsonResponse({'departements': list(departements)})
+        departements = renaloc_cache.get_or_set(
+            f'departements:{region_id}', ['departement'],
+            lambda: list(Departement.objects.filter(region_id=region_id).values('id', 'nom', 'code'))
+        )
+        return JsonResponse({'departements': departements})
     return JsonResponse({'departements': []})
 
 @staff_member_required
@@ -40,8 +57,11 @@ def get_communes(request):
     """Vue pour obtenir les communes d'un département"""
     departement_id = request.GET.get('departement_id')
     if departement_id:
-        communes = Commune.objects.filter(departement_id=departement_id).values('id', 'nom', 'code')
-        return JsonResponse({'communes': list(communes)})
+        communes = renaloc_cache.get_or_set(
+            f'communes:{departement_id}', ['commune'],
+            lambda: list(Commune.objects.filter(departement_id=departement_id).values('id', 'nom', 'code'))
+        )
+        return JsonResponse({'communes': communes})
     return JsonResponse({'communes': []})
 
 @staff_member_required
@@ -49,40 +69,96 @@ def get_quartiers(request):
     """Vue pour obtenir les quartiers d'une commune"""
     commune_id = request.GET.get('commune_id')
     if commune_id:
-        quartiers = QuartierVillage.objects.filter(commune_id=commune_id).values('id', 'nom', 'code')
-        return JsonResponse({'quartiers': list(quartiers)})
+        quartiers = renaloc_cache.get_or_set(
+            f'quartiers:{commune_id}', ['quartiervillage'],
+            lambda: list(QuartierVillage.objects.filter(commune_id=commune_id).values('id', 'nom', 'code'))
+        )
+        return JsonResponse({'quartiers': quartiers})
     return JsonResponse({'quartiers': []})
-    
-@staff_member_required
-def get_communes(request):
-    """Vue pour obtenir les communes d'un département"""
-    departement_id = request.GET.get('departement_id')
-    if departement_id:
-        communes = Commune.objects.filter(
-            departement_id=departement_id
-        ).values('id', 'nom', 'code')
-        return JsonResponse({'communes': list(communes)})
-    return JsonResponse({'communes': []})
 
 @staff_member_required
 def search_locations(request):
-    """Vue pour l'auto-complétion dans l'admin"""
+    """
+    Vue pour l'auto-complétion dans l'admin : régions, départements, communes et
+    quartiers/villages, insensible aux accents, classée (préfixe d'abord)
+    """
     term = request.GET.get('term', '')
-    results = []
-    
-    # Recherche dans les régions
-    regions = Region.objects.filter(nom__icontains=term)[:5]
-    for r in regions:
-        results.append({'label': f"Région: {r.nom}", 'value': r.nom, 'type': 'region'})
-    
-    # Recherche dans les départements
-    depts = Departement.objects.filter(nom__icontains=term)[:5]
-    for d in depts:
-        results.append({'label': f"Département: {d.nom}", 'value': d.nom, 'type': 'departement'})
-    
-    # Recherche dans les communes
-    communes = Commune.objects.filter(nom__icontains=term)[:5]
-    for c in communes:
-        results.append({'label': f"Commune: {c.nom}", 'value': c.nom, 'type': 'commune'})
-    
-    return JsonResponse(results, safe=False)
\ No newline at end of file
+    try:
+        limite = min(max(int(request.GET.get('limit', LIMITE_PAR_TYPE)), 1), 20)
+    except ValueError:
+        limite = LIMITE_PAR_TYPE
+    results = index_recherche().rechercher(term, limite)
+    return JsonResponse(results, safe=False)
+
+
+def hierarchie_version():
+    """
+    Version de la hiérarchie Renaloc : (ETag, date de dernière modification).
+    Le nombre d'enregistrements est inclus pour détecter aussi les suppressions.
+    Mise en cache jusqu'à la prochaine modification d'une localité.
+    """
+    return renaloc_cache.get_or_set('hierarchie:version', renaloc_cache.MODELES, _calculer_hierarchie_version)
+
+
+def _calculer_hierarchie_version():
+    empreinte = []
+    derniere_maj = None
+    for model in (Region, Departement, Commune, QuartierVillage):
+        stats = model.objects.aggregate(maj=Max('updated_at'), total=Count('id'))
+        empreinte.append(f"{stats['total']}:{stats['maj'].isoformat() if stats['maj'] else ''}")
+        if stats['maj'] and (derniere_maj is None or stats['maj'] > derniere_maj):
+            derniere_maj = stats['maj']
+    etag = hashlib.md5('|'.join(empreinte).encode()).hexdigest()
+    return etag, derniere_maj
+
+
+def construire_hierarchie(avec_quartiers=False):
+    """
+    Arbre région -> département -> commune (-> quartier) au format compact :
+    chaque niveau est indexé par l'id du parent, chaque entrée est [id, code, nom(, type)]
+    """
+    data = {
+        'regions': [list(r) for r in Region.objects.order_by('nom').values_list('id', 'code', 'nom')],
+        'departements': {},
+        'communes': {},
+    }
+    for id_, code, nom, region_id in Departement.objects.order_by('nom').values_list('id', 'code', 'nom', 'region_id'):
+        data['departements'].setdefault(region_id, []).append([id_, code, nom])
+    for id_, code, nom, type_commune, departement_id in Commune.objects.order_by('nom').values_list(
+            'id', 'code', 'nom', 'type_commune', 'departement_id'):
+        data['communes'].setdefault(departement_id, []).append([id_, code, nom, type_commune])
+    if avec_quartiers:
+        data['quartiers'] = {}
+        for id_, code, nom, commune_id in QuartierVillage.objects.order_by('nom').values_list(
+                'id', 'code', 'nom', 'commune_id').iterator(chunk_size=5000):
+            data['quartiers'].setdefault(commune_id, []).append([id_, code, nom])
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+@login_required
+@require_GET
+def hierarchie(request):
+    """
+    Hiérarchie complète des localités en une seule réponse JSON pour les selects en cascade.
+    ?quartiers=1 ajoute les quartiers/villages. La réponse porte ETag et Last-Modified
+    (requêtes conditionnelles -> 304) et le JSON sérialisé est mis en cache
+    jusqu'au prochain changement de la hiérarchie.
+    """
+    avec_quartiers = request.GET.get('quartiers') in ('1', 'true', 'oui')
+    etag, derniere_maj = hierarchie_version()
+    etag = f'"{etag}{"-q" if avec_quartiers else ""}"'
+    last_modified = int(derniere_maj.timestamp()) if derniere_maj else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        payload = renaloc_cache.get_or_set(
+            f"hierarchie:{'quartiers' if avec_quartiers else 'communes'}", renaloc_cache.MODELES,
+            lambda: construire_hierarchie(avec_quartiers)
+        )
+        response = HttpResponse(payload, content_type='application/json')
+
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    return response